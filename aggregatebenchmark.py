@@ -0,0 +1,192 @@
+import loadpath
+import getopt
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import cfunctionwrapper
+from policybenchmark import DEFAULT_COMPILE_COMMAND, getCompileArguments
+
+USAGE = 'Usage:\n\n' + __file__ + ''' [-o directory] [-c compile_command] [-f functions]
+        [-n calls] [--no-run]'''
+
+DESCRIPTION = '''
+Compare the size of the aggregate wrappers and the cost of calls through
+their interfaces with the default layout and with --flat
+
+Generates the MasterC wrappers of a number of small C functions with both
+layouts, and a C++ program printing the size of each MasterCWrapper and
+timing calls to the first and the last function through IMasterCWrapper.
+The program is then compiled and run.  The interface is reached through a
+pointer the compiler cannot see through, and the timed functions have a
+second implementation standing in for the mock, as in code that is handed
+its wrapper
+
+directory               [Default: A temporary directory] Directory the wrappers,
+                        the program and its executable are written to
+compile_command         [Default: cl.exe /nologo /EHsc /O2 on Windows, else the
+                        CXX environment variable or c++, with -O2] Command
+                        compiling a C++ source file into an executable
+functions               [Default: 200] Number of functions in the aggregate
+calls                   [Default: 100000000] Number of calls timed per variant
+
+--no-run = Only write the wrappers and the program
+'''
+
+DEFAULT_FUNCTIONS = 200
+DEFAULT_CALLS = 100000000
+
+'''
+The benchmark program
+
+{0} = Number of calls timed per variant
+{1} = Definitions of the C functions
+{2} = Name of the first function
+{3} = Name of the last function
+'''
+PROGRAM_TEMPLATE = '''#include <chrono>
+#include <cstdio>
+#include <Inherited/Component/CWrappers.h>
+#include <Flat/Component/CWrappers.h>
+
+{1}
+static const int CALLS = {0};
+static volatile int sink;
+
+template <class Call>
+static void timeCalls(const char* name, Call call)
+{{
+    std::chrono::steady_clock::time_point start = std::chrono::steady_clock::now();
+    int total = 0;
+    for (int i = 0; i < CALLS; ++i)
+    {{
+        total = call(total, i);
+    }}
+    std::chrono::duration<double, std::nano> elapsed = std::chrono::steady_clock::now() - start;
+    sink = total;
+    std::printf("%-16s %8.3f ns/call\\n", name, elapsed.count() / CALLS);
+}}
+
+// Stand in for the mocks of the unit tests.  With a single implementation of
+// the timed functions the compiler may guess the target of every call
+template <class Component>
+class Fake : public Component
+{{
+public:
+    int my{2}(int total, int value) const
+    {{
+        return total - value;
+    }}
+
+    int my{3}(int total, int value) const
+    {{
+        return total - value;
+    }}
+}};
+
+template <class Interface, class Component>
+static void timeLayout(const char* first, const char* last)
+{{
+    Component component;
+    Fake<Component> fake;
+    Interface* volatile opaque = sink ? static_cast<Interface*>(&fake) : &component;
+    const Interface& wrapper = *opaque;
+
+    timeCalls(first, [&](int total, int value) {{ return wrapper.my{2}(total, value); }});
+    timeCalls(last, [&](int total, int value) {{ return wrapper.my{3}(total, value); }});
+}}
+
+int main()
+{{
+    std::printf("%-16s %8u bytes\\n", "inherited size", (unsigned)sizeof(Inherited::Component::MasterCWrapper));
+    std::printf("%-16s %8u bytes\\n", "flat size", (unsigned)sizeof(Flat::Component::MasterCWrapper));
+
+    timeLayout<Inherited::IMasterCWrapper, Inherited::Component::MasterCWrapper>("inherited first", "inherited last");
+    timeLayout<Flat::IMasterCWrapper, Flat::Component::MasterCWrapper>("flat first", "flat last");
+    return 0;
+}}
+'''
+
+def getFunctionNames(functions):
+    return ['bench_function_{0}'.format(i) for i in range(functions)]
+
+def writeSources(directory, functions=DEFAULT_FUNCTIONS, calls=DEFAULT_CALLS):
+    '''
+    Writes the header, the wrappers with both layouts and the program into
+    directory.  Returns the path of the program
+    '''
+    names = getFunctionNames(functions)
+    with open(os.path.join(directory, 'bench.h'), 'wt') as file:
+        file.write('#ifdef __cplusplus\nextern "C" {\n#endif\n\n')
+        for name in names:
+            file.write('int {0}(int total, int value);\n'.format(name))
+        file.write('\n#ifdef __cplusplus\n}\n#endif\n')
+
+    function_file = os.path.join(directory, 'bench.yaml')
+    with open(function_file, 'wt') as file:
+        file.write('Functions:\n')
+        for name in names:
+            file.write('  - {{name: {0}, real_header: bench.h, include_header: bench.h}}\n'.format(name))
+        file.write('Aggregators: []\n')
+
+    cwd = os.getcwd()
+    original_stdout = sys.stdout
+    os.chdir(directory)
+    sys.stdout = io.StringIO()
+    try:
+        for namespace, flat in (('Inherited', False), ('Flat', True)):
+            cfunctionwrapper.generate(function_file, directory + cfunctionwrapper.PATH_SEPARATOR,
+                generateGmock=False, base_namespace=namespace, use_cache=False, force=True, flat=flat)
+    finally:
+        sys.stdout = original_stdout
+        os.chdir(cwd)
+
+    definitions = ''.join(
+        'extern "C" int {0}(int total, int value)\n{{\n    return total + value;\n}}\n\n'.format(name)
+        for name in names)
+    program = os.path.join(directory, 'aggregatebenchmark.cpp')
+    with open(program, 'wt') as file:
+        file.write(PROGRAM_TEMPLATE.format(calls, definitions, names[0], names[-1]))
+    return program
+
+def usage():
+    print(USAGE + '\n' + DESCRIPTION)
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'o:c:f:n:', ['output=', 'compile=', 'functions=', 'calls=', 'no-run'])
+        directory = None
+        compile_command = DEFAULT_COMPILE_COMMAND
+        functions = DEFAULT_FUNCTIONS
+        calls = DEFAULT_CALLS
+        run = True
+        for o, a in opts:
+            if o in ('-o', '--output'):
+                directory = os.path.abspath(a)
+            elif o in ('-c', '--compile'):
+                compile_command = a
+            elif o in ('-f', '--functions'):
+                functions = int(a)
+            elif o in ('-n', '--calls'):
+                calls = int(a)
+            elif o == '--no-run':
+                run = False
+    except (getopt.GetoptError, ValueError) as err:
+        print(err)
+        usage()
+        sys.exit(2)
+
+    if directory is None:
+        directory = tempfile.mkdtemp()
+    elif not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    program = writeSources(directory, functions, calls)
+    print('Wrote {0}'.format(program))
+    if not run:
+        sys.exit(0)
+
+    executable = os.path.join(directory, 'aggregatebenchmark' + ('.exe' if os.name == 'nt' else ''))
+    subprocess.check_call(getCompileArguments(compile_command, directory, program, executable), cwd=directory)
+    subprocess.check_call([executable])
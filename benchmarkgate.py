@@ -0,0 +1,183 @@
+import loadpath
+import getopt
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+from benchmarks import measureMemory
+from syntheticbenchmarks import prepareSize, getStages, timeRuns
+
+USAGE = 'Usage:\n\n' + __file__ + ''' [-b baseline_file] [-t threshold] [-m memory_threshold]
+        [-r repeat] [-s sizes] [--update]'''
+
+DESCRIPTION = '''
+Fail when the tokenizers, the AST builder or generate() got slower or use
+more memory than recorded in a baseline
+
+Every stage is timed repeat times on the synthetic headers of
+syntheticbenchmarks.py after one untimed warm-up run; stages faster than
+50 ms are run in a loop for each sample.  A stage regressed
+when its median time grew by more than threshold, or its peak memory grew
+by more than memory_threshold.  Prints every stage with its change and
+exits with status 1 if any stage regressed.  Timings only compare between
+runs on the same machine, so refresh the baseline with --update when
+switching machines
+
+baseline_file           [Default: benchmark_baseline.json next to this script]
+                        Timings and peak memory to compare against
+threshold               [Default: 0.25] Allowed relative growth of the time of a
+                        stage
+memory_threshold        [Default: 0.10] Allowed relative growth of the peak memory
+                        of a stage
+repeat                  [Default: 7] Number of timed runs of each stage
+sizes                   [Default: The sizes in the baseline, or 100,1000 with
+                        --update] Comma separated numbers of functions per header
+
+--update = Measure and save a new baseline_file instead of comparing with it
+'''
+
+FILE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(FILE_DIR, 'benchmark_baseline.json')
+DEFAULT_SIZES = (100, 1000)
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_MEMORY_THRESHOLD = 0.10
+DEFAULT_REPEAT = 7
+
+'''Fast stages are called in a loop until each timed sample takes this long'''
+MIN_SAMPLE_TIME = 0.05
+
+'''The stages of syntheticbenchmarks.py that are gated'''
+GATED_STAGES = ('tokenize', 'tokenize_regex', 'ast', 'generate')
+
+def measure(sizes, repeat, parameters=3):
+    '''Returns the median and fastest time and peak memory of each gated stage for each size'''
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        for functions in sizes:
+            stages = getStages(directory, *prepareSize(directory, functions, parameters))
+            measured = {}
+            for name in GATED_STAGES:
+                # The first call also pays for warming up caches and imports
+                stage = stages[name]
+                warmup, = timeRuns(stage, 1)
+                loops = max(1, int(math.ceil(MIN_SAMPLE_TIME / warmup)))
+                times = [sample / loops for sample in timeRuns(lambda: [stage() for i in range(loops)], repeat)]
+                unused, current, peak = measureMemory(stage)
+                measured[name] = {
+                    'median': statistics.median(times),
+                    'min': min(times),
+                    'peak_memory': peak}
+            results.append({'functions': functions, 'stages': measured})
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': parameters,
+        'repeat': repeat,
+        'sizes': results,
+        }
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD, memory_threshold=DEFAULT_MEMORY_THRESHOLD):
+    '''
+    Returns a (functions, stage, metric, baseline, current, change, regressed)
+    row for the median time and the peak memory of every stage in current.
+    Stages missing from baseline have None as their baseline and never
+    regress
+    '''
+    recorded = dict((result['functions'], result['stages']) for result in baseline['sizes'])
+
+    rows = []
+    for result in current['sizes']:
+        for name in GATED_STAGES:
+            now = result['stages'][name]
+            before = recorded.get(result['functions'], {}).get(name)
+            if before is None:
+                rows.append((result['functions'], name, 'time', None, now['median'], None, False))
+                rows.append((result['functions'], name, 'memory', None, now['peak_memory'], None, False))
+                continue
+
+            change = now['median'] / before['median'] - 1
+            regressed = change > threshold
+            rows.append((result['functions'], name, 'time', before['median'], now['median'], change, regressed))
+
+            change = now['peak_memory'] / float(before['peak_memory'] or 1) - 1
+            regressed = change > memory_threshold
+            rows.append((result['functions'], name, 'memory', before['peak_memory'], now['peak_memory'], change, regressed))
+
+    return rows
+
+def printComparison(rows):
+    print('{0:>10} {1:<16} {2:<8} {3:>14} {4:>14} {5:>9}'.format('functions', 'stage', 'metric', 'baseline', 'current', 'change'))
+    for functions, name, metric, before, now, change, regressed in rows:
+        unit = '{0:>13.4f}s' if metric == 'time' else '{0:>13.0f}B'
+        print('{0:>10} {1:<16} {2:<8} {3:>14} {4:>14} {5:>9}{6}'.format(
+            functions,
+            name,
+            metric,
+            unit.format(before) if before is not None else 'new',
+            unit.format(now),
+            '{0:+.1%}'.format(change) if change is not None else '',
+            '  REGRESSED' if regressed else ''))
+
+def usage():
+    print(USAGE + '\n' + DESCRIPTION)
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'b:t:m:r:s:', ['baseline=', 'threshold=', 'memory-threshold=', 'repeat=', 'sizes=', 'update'])
+        baseline_file = DEFAULT_BASELINE
+        threshold = DEFAULT_THRESHOLD
+        memory_threshold = DEFAULT_MEMORY_THRESHOLD
+        repeat = DEFAULT_REPEAT
+        sizes = None
+        update = False
+        for o, a in opts:
+            if o in ('-b', '--baseline'):
+                baseline_file = a
+            elif o in ('-t', '--threshold'):
+                threshold = float(a)
+            elif o in ('-m', '--memory-threshold'):
+                memory_threshold = float(a)
+            elif o in ('-r', '--repeat'):
+                repeat = int(a)
+            elif o in ('-s', '--sizes'):
+                sizes = [int(size) for size in a.split(',')]
+            elif o == '--update':
+                update = True
+    except (getopt.GetoptError, ValueError) as err:
+        print(err)
+        usage()
+        sys.exit(2)
+
+    if update:
+        current = measure(sizes or DEFAULT_SIZES, repeat)
+        with open(baseline_file, 'wt') as file:
+            json.dump(current, file, indent=1, sort_keys=True)
+        print('Saved baseline {0}'.format(baseline_file))
+        sys.exit(0)
+
+    try:
+        with open(baseline_file, 'rt') as file:
+            baseline = json.load(file)
+    except (IOError, ValueError) as err:
+        print('Could not read baseline {0}: {1}'.format(baseline_file, err))
+        print('Create it with --update')
+        sys.exit(2)
+
+    current = measure(sizes or [result['functions'] for result in baseline['sizes']], repeat)
+    rows = compare(baseline, current, threshold, memory_threshold)
+    printComparison(rows)
+
+    regressions = [row for row in rows if row[-1]]
+    if regressions:
+        print('{0} of {1} measurements regressed beyond the allowed {2:.0%} time and {3:.0%} memory growth'.format(
+            len(regressions), len(rows), threshold, memory_threshold))
+        sys.exit(1)
+    print('No regressions')
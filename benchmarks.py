@@ -0,0 +1,242 @@
+import loadpath
+import getopt
+import os
+import sys
+import time
+import tracemalloc
+import cfunctionwrapper
+from cpp import ast
+from cpp import tokenize
+from includeresolver import IncludeResolver
+import yaml
+
+USAGE = 'Usage:\n\n' + __file__ + ''' benchmark function_file [-i include_path] [-r repeat]'''
+
+DESCRIPTION = '''
+Time the stages of the wrapper generator on real headers
+
+benchmark               [Required] One of: prescan, tokenize, memory,
+                        declarations, filter
+function_file           [Required] Functions file in the cfunctionwrapper.py format;
+                        every real_header it lists is benchmarked
+include_path            [Default: The INCLUDE environment variable] C compiler
+                        include path
+repeat                  [Default: 5] Number of timed runs; the fastest is reported
+
+prescan                 Parse each header for its requested functions with and
+                        without the pre-scan that extracts their declarations
+tokenize                Tokenize each header with the character scanner and the
+                        regex tokenizer and report their throughput in MB/s
+memory                  Report the memory held by each header's tokens and the
+                        time and peak memory of building its whole AST
+declarations            Build each header's whole AST with and without the
+                        declarations-only mode that skips bodies
+filter                  Build each header's declarations with and without a
+                        filter for the requested function names
+'''
+
+def timeCall(func, repeat):
+    '''Returns (fastest wall time in seconds, result of the last call)'''
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def getHeaders(function_file, include_path):
+    '''Returns [(real_header, path, [function names])] in function file order'''
+    with open(function_file, 'rt') as file:
+        configuration = yaml.safe_load(file.read())
+
+    includeDirs = include_path.split(cfunctionwrapper.PATH_SEPARATOR)
+    includeDirs.remove(includeDirs[len(includeDirs)-1])
+    resolver = IncludeResolver(includeDirs)
+
+    headers = []
+    names = {}
+    for item in configuration['Functions']:
+        real_loc = item['real_header']
+        if real_loc not in names:
+            names[real_loc] = []
+            headers.append(real_loc)
+        if item['name'] not in names[real_loc]:
+            names[real_loc].append(item['name'])
+
+    found = []
+    for real_loc in headers:
+        path = resolver.resolve(real_loc)
+        if path is None:
+            print('Could not find {0}'.format(real_loc))
+            continue
+        found.append((real_loc, path, names[real_loc]))
+
+    return found
+
+def benchmarkPrescan(headers, repeat):
+    print('{0:<24} {1:>10} {2:>12} {3:>12} {4:>8}'.format('header', 'bytes', 'full (s)', 'prescan (s)', 'speedup'))
+    for real_loc, path, names in headers:
+        full, expected = timeCall(lambda: cfunctionwrapper.parseHeader(path, names, prescan=False), repeat)
+        windowed, actual = timeCall(lambda: cfunctionwrapper.parseHeader(path, names), repeat)
+
+        if [p.function_name() for p in expected] != [p.function_name() for p in actual]:
+            print('{0}: the pre-scan found different functions than a full parse'.format(real_loc))
+
+        print('{0:<24} {1:>10} {2:>12.4f} {3:>12.4f} {4:>7.1f}x'.format(
+            real_loc,
+            os.path.getsize(path),
+            full,
+            windowed,
+            full / windowed))
+
+def benchmarkTokenize(headers, repeat):
+    print('{0:<24} {1:>10} {2:>12} {3:>12} {4:>8}'.format('header', 'bytes', 'scan (MB/s)', 'regex (MB/s)', 'speedup'))
+    for real_loc, path, names in headers:
+        with open(path, 'rt') as file:
+            source = file.read()
+        
+        tokens = lambda tokenizer: [(t.token_type, t.name, t.start, t.end) for t in tokenizer(source)]
+        scan, expected = timeCall(lambda: tokens(tokenize.GetTokens), repeat)
+        regex, actual = timeCall(lambda: tokens(tokenize.GetTokensRegex), repeat)
+        
+        if expected != actual:
+            print('{0}: the regex tokenizer produced different tokens'.format(real_loc))
+        
+        megabytes = len(source) / (1024.0 * 1024.0)
+        print('{0:<24} {1:>10} {2:>12.2f} {3:>12.2f} {4:>7.1f}x'.format(
+            real_loc,
+            len(source),
+            megabytes / scan,
+            megabytes / regex,
+            scan / regex))
+
+def measureMemory(func):
+    '''Returns (result of func, bytes still allocated by it, peak bytes allocated)'''
+    tracemalloc.start()
+    try:
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+def countNodes(func):
+    '''Returns (result of func, number of AST nodes it created)'''
+    created = [0]
+    init = ast.Node.__init__
+    def countingInit(self, *args):
+        created[0] += 1
+        init(self, *args)
+    
+    ast.Node.__init__ = countingInit
+    try:
+        result = func()
+    finally:
+        ast.Node.__init__ = init
+    return result, created[0]
+
+def benchmarkMemory(headers, repeat):
+    print('{0:<24} {1:>10} {2:>10} {3:>12} {4:>12} {5:>12}'.format('header', 'tokens', 'B/token', 'tokens (MB)', 'parse (s)', 'peak (MB)'))
+    for real_loc, path, names in headers:
+        with open(path, 'rt') as file:
+            source = file.read()
+        
+        tokens, held, peak = measureMemory(lambda: list(tokenize.GetTokensRegex(source)))
+        count = len(tokens)
+        del tokens
+        
+        parse = lambda: [node for node in ast.BuilderFromSource(source, path, tokenize.GetTokensRegex).Generate()]
+        elapsed, nodes = timeCall(parse, repeat)
+        nodes, current, peak = measureMemory(parse)
+        
+        megabytes = 1024.0 * 1024.0
+        print('{0:<24} {1:>10} {2:>10.1f} {3:>12.2f} {4:>12.4f} {5:>12.2f}'.format(
+            real_loc,
+            count,
+            held / float(count or 1),
+            held / megabytes,
+            elapsed,
+            peak / megabytes))
+
+def benchmarkDeclarations(headers, repeat):
+    print('{0:<24} {1:>10} {2:>12} {3:>12} {4:>8}'.format('header', 'bytes', 'full (s)', 'decls (s)', 'speedup'))
+    for real_loc, path, names in headers:
+        with open(path, 'rt') as file:
+            tokens = list(tokenize.GetTokensRegex(file.read()))
+        
+        def parse(declarations_only):
+            builder = ast.AstBuilder(iter(tokens), path, declarations_only=declarations_only)
+            return [node.name for node in builder.Generate() if isinstance(node, ast.Function)]
+        full, expected = timeCall(lambda: parse(False), repeat)
+        declarations, actual = timeCall(lambda: parse(True), repeat)
+        
+        if expected != actual:
+            print('{0}: declarations-only mode found different functions'.format(real_loc))
+        
+        print('{0:<24} {1:>10} {2:>12.4f} {3:>12.4f} {4:>7.1f}x'.format(
+            real_loc,
+            os.path.getsize(path),
+            full,
+            declarations,
+            full / declarations))
+
+def benchmarkFilter(headers, repeat):
+    print('{0:<24} {1:>10} {2:>12} {3:>12} {4:>8} {5:>12} {6:>12}'.format('header', 'bytes', 'all (s)', 'filter (s)', 'speedup', 'all (nodes)', 'filter (nodes)'))
+    for real_loc, path, names in headers:
+        with open(path, 'rt') as file:
+            tokens = list(tokenize.GetTokensRegex(file.read()))
+        
+        def parse(name_filter):
+            builder = ast.AstBuilder(iter(tokens), path, declarations_only=True, name_filter=name_filter)
+            return [str(node) for node in builder.Generate() if isinstance(node, ast.Function) and node.name in names]
+        everything, expected = timeCall(lambda: parse(None), repeat)
+        filtered, actual = timeCall(lambda: parse(set(names).__contains__), repeat)
+        unused, everything_nodes = countNodes(lambda: parse(None))
+        unused, filtered_nodes = countNodes(lambda: parse(set(names).__contains__))
+        
+        if expected != actual:
+            print('{0}: the filter changed the requested functions'.format(real_loc))
+        
+        print('{0:<24} {1:>10} {2:>12.4f} {3:>12.4f} {4:>7.1f}x {5:>12} {6:>12}'.format(
+            real_loc,
+            os.path.getsize(path),
+            everything,
+            filtered,
+            everything / filtered,
+            everything_nodes,
+            filtered_nodes))
+
+BENCHMARKS = {
+    'prescan': benchmarkPrescan,
+    'tokenize': benchmarkTokenize,
+    'memory': benchmarkMemory,
+    'declarations': benchmarkDeclarations,
+    'filter': benchmarkFilter,
+    }
+
+def usage():
+    print(USAGE + '\n' + DESCRIPTION)
+
+if __name__ == '__main__':
+    try:
+        benchmark = BENCHMARKS[sys.argv[1]]
+        function_file = sys.argv[2]
+        opts, args = getopt.getopt(sys.argv[3:], 'i:r:', ['include_path=', 'repeat='])
+    except (IndexError, KeyError, getopt.GetoptError):
+        usage()
+        sys.exit(2)
+
+    include_path = ''
+    repeat = 5
+    for o, a in opts:
+        if o in ('-i', '--include_path'):
+            include_path = a
+        elif o in ('-r', '--repeat'):
+            repeat = int(a)
+
+    if include_path == '':
+        include_path = cfunctionwrapper.getIncludeEnvVar()
+
+    benchmark(getHeaders(function_file, include_path), repeat)
@@ -1,18 +1,33 @@
 import loadpath
+import concurrent.futures
+import contextlib
+import functools
 import os
 import sys
+import time
 import texttemplates
 import getopt
 from cpp import ast
+from cpp import tokenize
 from cfwclasses import *
+from prototypecache import PrototypeCache, MemoryCache, DEFAULT_CACHE_DIR
+from includeresolver import IncludeResolver
+from prescan import extractDeclarations
+from manifest import Manifest, OutputWriter, MANIFEST_FILE, writeIfChanged
+from generationstats import GenerationStats, newHeaderStats, countTokens
 import yaml
 
 PATH_SEPARATOR = ';' if os.name == 'nt' else ':'
 BASE_INCLUDE = 'CWrappers'
+WATCH_INTERVAL = 1.0
+COMPONENT_SOURCE_FILE = 'CWrappers.cpp'
 
 USAGE = 'Usage:\n\n' + __file__ + ''' functionList [-i include_path] [-n] [-b base_namespace]
         [-m mock_namespace] [-c component_namespace] [-p funcPrefix]
-        [-s component_suffix]'''
+        [-s component_suffix] [--no-cache] [--cache-dir cache_dir] [-j jobs]
+        [--regex-tokenizer] [-f] [--depfile depfile] [--watch]
+        [--stats stats_file] [--policy] [--final] [--flat] [--table]
+        [--out-of-line]'''
 
 DESCRIPTION = '''
 Generate C++ C-function wrapper classes
@@ -38,8 +53,78 @@ funcPrefix              [Default: 'my'] Prefix to wrapper functions. This is use
                         to prevent colliding with the wrapped C function
 component_suffix        [Default: 'Wrapper'] Suffix that will be appended to class
                         names of generated Component classes
+
+--no-cache = Always parse the headers, ignoring the prototype cache
+cache_dir               [Default: '.cfwcache'] Directory where the prototypes parsed
+                        from each header are cached between runs
+jobs                    [Default: 1] Number of worker processes used to parse
+                        headers in parallel
+
+--regex-tokenizer = Tokenize headers with a single compiled regex instead of
+                    scanning them a character at a time
+
+-f = Regenerate every file even if the manifest says the wrappers are up to
+     date.  Without it, nothing is parsed or written when the function file,
+     the options and the headers are unchanged since the last run, and only
+     output files whose contents differ are rewritten
+depfile                 [Default: None] Path of a Make-compatible dependency file
+                        listing the function file, the headers that were parsed
+                        and the templates as prerequisites of the generated files
+
+--watch = Keep running, and regenerate the wrappers whenever the function file
+          or one of its headers changes.  The prototypes of every header are
+          kept in memory, so only headers that changed are parsed again
+stats_file              [Default: None] Path of a JSON file to write the time spent
+                        in each stage, on each header and on each aggregate to,
+                        along with token, node and byte counts and peak memory
+
+--policy = Generate statically bound policy wrappers instead of virtual ones.
+           The interfaces become class templates taking the class that
+           implements them, and the components and mocks derive from the
+           interface bound to themselves, so calls through the interfaces
+           can be inlined.  Code using them is written as templates of the
+           wrapper it calls
+
+--final = Mark the components and their functions final, and the functions
+          wrapping C functions their header declares not to throw noexcept,
+          so calls on a known component type can be inlined.  Needs C++11
+
+--flat = Declare every function of an aggregate in its interface instead of
+         inheriting the interface of each function, so aggregates hold a
+         single virtual table pointer.  Functions given narrow: true in the
+         function file keep their interface as a base of every aggregate
+         they are in, so the aggregates can still be passed as it
+
+--table = Generate a plain struct of function pointers for each aggregate
+          instead of classes, so each call is a single indirect call and
+          all the functions of an aggregate are swapped at once by
+          assigning its table.  The component is a function returning the
+          table of the real C functions, and the mock fills a table with
+          functions calling it.  Cannot be used with --policy, --final or
+          --flat
+
+--out-of-line = Only declare the functions of the components in their header,
+                and define them in a source file for each aggregate, named
+                after its component, and in CWrappers.cpp for the components
+                of single functions.  The sources are added to the outputs,
+                and must be compiled into the code using the components.
+                Cannot be used with --policy or --table
 '''
-def generate(function_file, include_path = '', generateGmock=True, base_namespace = '', mock_namespace = 'Mock', component_namespace = 'Component', funcPrefix='my', component_suffix = 'Wrapper'):
+'''The options of generate() choosing the kind of wrappers, of which only some can be combined'''
+MODE_OPTIONS = ('policy', 'final', 'flat', 'table', 'out_of_line')
+
+def checkModes(policy=False, final=False, flat=False, table=False, out_of_line=False):
+    '''Raises an Exception if the kinds of wrappers chosen cannot be combined'''
+    if policy and flat:
+        raise Exception('Policy wrappers have no virtual functions to flatten, so --flat cannot be used with --policy')
+    if table and (policy or final or flat):
+        raise Exception('Function pointer tables replace the wrapper classes, so --table cannot be used with --policy, --final or --flat')
+    if out_of_line and (policy or table):
+        raise Exception('Policy wrappers and tables are only inlined when defined in the header, so --out-of-line cannot be used with --policy or --table')
+
+def generate(function_file, include_path = '', generateGmock=True, base_namespace = '', mock_namespace = 'Mock', component_namespace = 'Component', funcPrefix='my', component_suffix = 'Wrapper', use_cache=True, cache_dir=DEFAULT_CACHE_DIR, jobs=1, regex_tokenizer=False, force=False, depfile=None, cache=None, stats_file=None, policy=False, final=False, flat=False, table=False, out_of_line=False):
+    checkModes(policy, final, flat, table, out_of_line)
+    stats = GenerationStats()
     if include_path == '':
         include_path = getIncludeEnvVar()
     
@@ -50,93 +135,315 @@ def generate(function_file, include_path = '', generateGmock=True, base_namespac
     full_component_dir = os.path.join(BASE_INCLUDE, os.path.normpath(getPathFromNamespace(fullComponentNamespace)))
     full_mock_dir = os.path.join(BASE_INCLUDE, os.path.normpath(getPathFromNamespace(fullMockNamespace)))
     
+    interface_file = os.path.join(full_interface_dir, 'ICWrappers.h')
+    component_file = os.path.join(full_component_dir, 'CWrappers.h')
+    mock_file = os.path.join(full_mock_dir, 'CWrappers.h')
+    outputs = [interface_file, component_file]
+    if generateGmock:
+        outputs.append(mock_file)
+    
     mkdirIfNotExist(full_interface_dir)
     mkdirIfNotExist(full_component_dir)
     
     if generateGmock:
         mkdirIfNotExist(full_mock_dir)
         
-    configuration = yaml.load(open(function_file, 'rt').read())
-    print('Parsing files')
-    prototypes, found_files = getFunctionASTs(include_path, configuration['Functions'])
+    with open(function_file, 'rt') as file:
+        config = file.read()
+    configuration = yaml.safe_load(config)
+    if out_of_line:
+        outputs.append(os.path.join(full_component_dir, COMPONENT_SOURCE_FILE))
+        for name in [aggregator['name'] for aggregator in configuration['Aggregators']] + ['MasterC']:
+            outputs.append(getComponentSourceFile(full_component_dir, name + component_suffix))
+    headers, found_files, funcsToFind = findHeaders(include_path, configuration['Functions'])
+    stats.endStage('setup')
+    
+    options = {
+        'include_path': include_path,
+        'generateGmock': generateGmock,
+        'base_namespace': base_namespace,
+        'mock_namespace': mock_namespace,
+        'component_namespace': component_namespace,
+        'funcPrefix': funcPrefix,
+        'component_suffix': component_suffix,
+        'policy': policy,
+        'final': final,
+        'flat': flat,
+        'table': table,
+        'out_of_line': out_of_line}
+    header_paths = [filePath for fileName, filePath in headers]
+    if depfile is not None:
+        writeDepfile(depfile, outputs, [function_file] + header_paths + [texttemplates.__file__])
+    
+    manifest = Manifest(os.path.join(full_interface_dir, MANIFEST_FILE))
+    upToDate = manifest.isUpToDate(config, options, header_paths)
+    stats.endStage('manifest')
+    if upToDate and not force:
+        print('Wrappers are up to date')
+        if stats_file is not None:
+            stats.save(stats_file)
+        return outputs
     
-    interface_classes = ''
-    component_classes = ''
+    print('Parsing files')
+    if cache is None and use_cache:
+        cache = PrototypeCache(cache_dir)
+    tokenizer = tokenize.GetTokensRegex if regex_tokenizer else tokenize.GetTokens
+    prototypes = parseHeaders(headers, funcsToFind, cache, jobs, tokenizer, stats if stats_file is not None else None)
+    stats.endStage('parse')
+    
+    component_declaration = texttemplates.CLASS_DECLARATION_TEMPLATE
+    if table:
+        Wrapper, Aggregate, interface_declaration = TableFunctionWrapper, TableFunctionAggregate, texttemplates.TABLE_DECLARATION_TEMPLATE
+        # Each component function returns the table named after it
+        component_declaration = texttemplates.TABLE_COMPONENT_DECLARATION_TEMPLATE.format('{0}', INTERFACE_PREFIX + '{0}')
+    elif policy:
+        Wrapper, Aggregate, interface_declaration = PolicyFunctionWrapper, PolicyFunctionAggregate, texttemplates.POLICY_DECLARATION_TEMPLATE
+    elif flat:
+        narrow = [function['name'] for function in configuration['Functions'] if function.get('narrow')]
+        Wrapper, Aggregate, interface_declaration = FunctionWrapper, functools.partial(FlatFunctionAggregate, narrow=narrow), texttemplates.CLASS_DECLARATION_TEMPLATE
+    else:
+        Wrapper, Aggregate, interface_declaration = FunctionWrapper, FunctionAggregate, texttemplates.CLASS_DECLARATION_TEMPLATE
+    
+    if out_of_line:
+        Wrapper = OutOfLineFunctionWrapper
     
     print('Generating wrappers')
     wrappers = []
     for prototype in prototypes:
-        wrapper = FunctionWrapper(prototype, base_namespace, component_namespace, mock_namespace, funcPrefix, component_suffix)
-        wrappers.append(wrapper)
-        
-        interface_classes += wrapper.interface_class()
-        component_classes += wrapper.component_class()
+        wrappers.append(Wrapper(prototype, base_namespace, component_namespace, mock_namespace, funcPrefix, component_suffix, final))
     
     aggregates = []
-    for aggregate in configuration['Aggregators']:
-        name = aggregate['name']
-        functions = aggregate['functions']
+    for name, ag_wrappers, missing in resolveAggregates(configuration['Aggregators'], wrappers):
+        if missing:
+            print('Aggregator {0} lists functions that were not wrapped: {1}'.format(name, ', '.join(missing)))
         
-        ag_wrappers = []
-        for wrapper in wrappers:
-            if wrapper.prototype.function_name() in functions:
-                ag_wrappers.append(wrapper)
-        
-        aggregator = FunctionAggregate(name, base_namespace, component_suffix, component_namespace, mock_namespace)
+        aggregator = Aggregate(name, base_namespace, component_suffix, component_namespace, mock_namespace, final)
         aggregator.wrappers = ag_wrappers
+        aggregator.missing = missing
         
         aggregates.append(aggregator)
     
-    master = FunctionAggregate('MasterC', base_namespace, component_suffix, component_namespace, mock_namespace)
+    master = Aggregate('MasterC', base_namespace, component_suffix, component_namespace, mock_namespace, final)
     master.wrappers = wrappers
     aggregates.append(master)
     
-    mock_classes = ''
-    
-    for aggregate in aggregates:
-        print('Generating {0} interface'.format(aggregate.name))
-        interface_classes += aggregate.interface_aggregate()
-        print('Generating {0} wrapper component'.format(aggregate.name))
-        component_classes += aggregate.component_aggregate()
-        if generateGmock:
-            print('Generating {0} mock wrapper'.format(aggregate.name))
-            mock_classes += aggregate.mock_aggregate()
-    
-    interface_file = os.path.join(full_interface_dir, 'ICWrappers.h')
-    print('Generating interface file {0}'.format(interface_file))
-    with open(interface_file, 'wt') as file:
-        file.write(texttemplates.INTERFACE_FILE_TEMPLATE.format(
+    # Every class is written out as soon as it is generated, so the memory
+    # used does not grow with the size of the generated files
+    writers = []
+    with contextlib.ExitStack() as files:
+        print('Generating interface file {0}'.format(interface_file))
+        interfaces, interface_footer = startOutput(files, writers, interface_file, texttemplates.INTERFACE_FILE_TEMPLATE,
             getHeaderGuard(base_namespace),
             getIncludes(found_files),
             getNamespaceHierarchy(
-                collectInterfaceNames(prototypes, aggregates),
-                base_namespace),
-            interface_classes))
-    
-    component_file = os.path.join(full_component_dir, 'CWrappers.h')
-    print('Generating component file {0}'.format(component_file))
-    with open(component_file, 'wt') as file:
-        file.write(texttemplates.COMPONENT_FILE_TEMPLATE.format(
+                collectInterfaceNames([] if table else prototypes, aggregates),
+                base_namespace,
+                interface_declaration),
+            None)
+        
+        print('Generating component file {0}'.format(component_file))
+        components, component_footer = startOutput(files, writers, component_file, texttemplates.COMPONENT_FILE_TEMPLATE,
             getHeaderGuard(fullComponentNamespace),
-            getIncludes(found_files),
+            '' if out_of_line else getIncludes(found_files),
             getPathFromNamespace(base_namespace),
             getNamespaceHierarchy(
-                getComponentDefinitions(prototypes, aggregates, component_suffix),
-                fullComponentNamespace),
-            component_classes))
+                getComponentDefinitions([] if table else prototypes, aggregates, component_suffix),
+                fullComponentNamespace,
+                component_declaration),
+            None)
+        
+        if generateGmock:
+            print('Generating mock file {0}'.format(mock_file))
+            mocks, mock_footer = startOutput(files, writers, mock_file, texttemplates.GMOCK_FILE_TEMPLATE,
+                getHeaderGuard(fullMockNamespace),
+                getPathFromNamespace(base_namespace),
+                None)
+        
+        for wrapper in wrappers:
+            interfaces.write(wrapper.interface_class())
+            components.write(wrapper.component_class())
+        if out_of_line:
+            writeComponentSource(files, writers, os.path.join(full_component_dir, COMPONENT_SOURCE_FILE), found_files, fullComponentNamespace,
+                [wrapper.component_source() for wrapper in wrappers])
+        stats.endStage('wrappers')
+        
+        for aggregate in aggregates:
+            start = time.perf_counter()
+            print('Generating {0} interface'.format(aggregate.name))
+            interfaces.writelines(aggregate.interface_aggregate_parts())
+            print('Generating {0} wrapper component'.format(aggregate.name))
+            components.writelines(aggregate.component_aggregate_parts())
+            if out_of_line:
+                writeComponentSource(files, writers, getComponentSourceFile(full_component_dir, aggregate.component_name()), found_files, fullComponentNamespace,
+                    aggregate.component_source_parts())
+            if generateGmock:
+                print('Generating {0} mock wrapper'.format(aggregate.name))
+                mocks.writelines(aggregate.mock_aggregate_parts())
+            stats.aggregate(aggregate.name, len(aggregate.wrappers), time.perf_counter() - start, aggregate.missing)
+        stats.endStage('aggregates')
+        
+        interfaces.write(interface_footer)
+        components.write(component_footer)
+        if generateGmock:
+            mocks.write(mock_footer)
     
-    if not generateGmock:
-        return
+    for writer in writers:
+        if not writer.written:
+            print('{0} is unchanged'.format(writer.path))
+        stats.output(writer.path, writer.size, writer.written)
+    removeStaleSources(manifest.outputs, outputs)
     
-    mock_file = os.path.join(full_mock_dir, 'CWrappers.h')
-    print('Generating mock file {0}'.format(mock_file))
-    with open(mock_file, 'wt') as file:
-        file.write(texttemplates.GMOCK_FILE_TEMPLATE.format(
-            getHeaderGuard(fullMockNamespace),
-            getPathFromNamespace(base_namespace),
-            mock_classes))
+    manifest.record(outputs)
+    manifest.save()
+    stats.endStage('write')
+    
+    if stats_file is not None:
+        stats.save(stats_file)
     
     print('Done!')
+    return outputs
+
+def watch(function_file, include_path='', use_cache=True, cache_dir=DEFAULT_CACHE_DIR, interval=WATCH_INTERVAL, **kwargs):
+    '''
+    Calls generate whenever function_file or a header it lists changes, until
+    interrupted.  Parsed prototypes are kept in memory between generations,
+    and headers are only looked up on the include path again after
+    function_file changed
+    '''
+    if include_path == '':
+        include_path = getIncludeEnvVar()
+    
+    cache = MemoryCache(PrototypeCache(cache_dir) if use_cache else None)
+    configuration = None
+    headers = []
+    seen = None
+    try:
+        while True:
+            stat = getFileStat(function_file)
+            if stat != configuration:
+                configuration = stat
+                headers = getWatchedHeaders(function_file, include_path)
+            
+            inputs = dict((path, getFileStat(path)) for path in [function_file] + headers)
+            if inputs != seen:
+                seen = inputs
+                try:
+                    generate(function_file, include_path, cache=cache, **kwargs)
+                except Exception as err:
+                    print('Generation failed: {0}'.format(err))
+                print('Watching {0} files for changes'.format(len(inputs)))
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+def getWatchedHeaders(function_file, include_path):
+    '''Returns the path of every header function_file lists that can be found'''
+    try:
+        with open(function_file, 'rt') as file:
+            configuration = yaml.safe_load(file.read())
+        headers = findHeaders(include_path, configuration['Functions'])[0]
+    except Exception:
+        return []
+    
+    return [filePath for fileName, filePath in headers]
+
+def getFileStat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime)
+
+def resolveAggregates(aggregators, wrappers):
+    '''
+    Returns (name, wrappers, missing) for each of the Aggregators entries of
+    a function file, with the wrappers of the functions it lists in the
+    order of wrappers, and the names it lists that match no wrapper.  The
+    wrappers are looked up in an index of their function names built once
+    '''
+    index = {}
+    for position, wrapper in enumerate(wrappers):
+        index.setdefault(wrapper.signature.function_name, []).append(position)
+    
+    resolved = []
+    for aggregator in aggregators:
+        functions = aggregator['functions']
+        if isinstance(functions, str):
+            functions = [functions]
+        
+        positions = set()
+        missing = []
+        for function in functions:
+            found = index.get(function)
+            if found is None:
+                missing.append(function)
+            else:
+                positions.update(found)
+        
+        resolved.append((aggregator['name'], [wrappers[position] for position in sorted(positions)], missing))
+    
+    return resolved
+
+def startOutput(files, writers, filePath, template, *args):
+    '''
+    Opens an OutputWriter for filePath, closed with the ExitStack files and
+    appended to writers, and writes the text of template up to its field
+    given as None in args.  Returns (writer, text of template after that
+    field)
+    '''
+    writer = files.enter_context(OutputWriter(filePath))
+    writers.append(writer)
+    header, footer = splitTemplate(template, *args)
+    writer.write(header)
+    return writer, footer
+
+def getComponentSourceFile(directory, component_name):
+    return os.path.join(directory, component_name + '.cpp')
+
+def writeComponentSource(files, writers, filePath, includes, componentNamespace, definitions):
+    '''
+    Writes the source file filePath defining the component functions out of
+    line, with definitions an iterable of their texts, as startOutput does.
+    Its text is complete when this returns, so sources are not held open
+    while the other outputs are generated, but like every other output it
+    is only moved to filePath when files is closed
+    '''
+    writer, footer = startOutput(files, writers, filePath, texttemplates.COMPONENT_SOURCE_FILE_TEMPLATE,
+        getIncludes(includes),
+        getPathFromNamespace(componentNamespace),
+        None)
+    writer.writelines(definitions)
+    writer.write(footer)
+    writer.finish()
+
+def removeStaleSources(recorded, outputs):
+    '''
+    Removes the sources among recorded, the outputs of the previous
+    generation, that are not among outputs, such as the source of an
+    aggregator that was removed or renamed, so they are not compiled with
+    the new components
+    '''
+    for filePath in sorted(set(recorded) - set(outputs)):
+        if filePath.endswith('.cpp') and os.path.exists(filePath):
+            print('Removing stale source {0}'.format(filePath))
+            os.remove(filePath)
+
+def writeDepfile(depfile, targets, prerequisites):
+    '''
+    Writes a Make rule making each of targets depend on every one of
+    prerequisites, in the format read by Make's include and Ninja's depfile
+    '''
+    def escape(path):
+        return path.replace(os.sep, '/').replace(' ', '\\ ').replace('#', '\\#').replace('$', '$$')
+    
+    unique = []
+    for path in prerequisites:
+        if path not in unique:
+            unique.append(path)
+    
+    writeIfChanged(depfile, '{0}: {1}\n'.format(
+        ' '.join(map(escape, targets)),
+        ' \\\n  '.join(map(escape, unique))))
 
 def getIncludeEnvVar():
     try:
@@ -154,9 +461,19 @@ def getFunctions(function_file):
     with open(function_file, 'rt') as file:
         return list(map(lambda x : x.strip().split(' '), file.readlines()))
 
-def getFunctionASTs(include_path, functionsToWrap):
+def getFunctionASTs(include_path, functionsToWrap, cache=None, jobs=1, tokenizer=tokenize.GetTokens):
+    headers, foundFiles, funcsToFind = findHeaders(include_path, functionsToWrap)
+    return parseHeaders(headers, funcsToFind, cache, jobs, tokenizer), foundFiles
+
+def findHeaders(include_path, functionsToWrap):
+    '''
+    Returns (headers, foundFiles, funcsToFind) where headers is the list of
+    (real_header, path) for every real_header found on include_path,
+    foundFiles is the include_header of each of them and funcsToFind maps
+    each real_header to the functions to wrap from it
+    '''
     filesToFind = []
-    funcsToFind = []
+    funcsToFind = {}
     
     for item in functionsToWrap:
         func = item['name']
@@ -165,39 +482,235 @@ def getFunctionASTs(include_path, functionsToWrap):
         
         if (real_loc, include) not in filesToFind:
             filesToFind.append((real_loc, include))
-        if func not in funcsToFind:
-            funcsToFind.append(func)
+        
+        missing = funcsToFind.setdefault(real_loc, [])
+        if func not in missing:
+            missing.append(func)
     
     includeDirs = include_path.split(PATH_SEPARATOR)
     includeDirs.remove(includeDirs[len(includeDirs)-1])
+    resolver = IncludeResolver(includeDirs)
     
-    prototypes = []
+    headers = []
     foundFiles = []
     for fileName, include in filesToFind:
-        for dir in includeDirs:
-            filePath = os.path.join(dir, fileName)
-            if not os.path.exists(filePath):
+        filePath = resolver.resolve(fileName)
+        if filePath is None:
+            continue
+        foundFiles.append(include)
+        headers.append((fileName, filePath))
+    
+    return headers, foundFiles, funcsToFind
+
+def parseHeaders(headers, funcsToFind, cache=None, jobs=1, tokenizer=tokenize.GetTokens, stats=None):
+    '''
+    Returns the FunctionPrototype of each function in funcsToFind that was
+    found.  The counters of each header are added to stats, a
+    GenerationStats, if given
+    '''
+    parsed = {}
+    if jobs > 1:
+        parsed = parseHeadersInParallel(headers, funcsToFind, cache, jobs, tokenizer, stats)
+    
+    prototypes = []
+    for fileName, filePath in headers:
+        missing = funcsToFind[fileName]
+        if not missing:
+            continue
+        
+        if filePath not in parsed:
+            header_stats = stats.header(fileName, filePath) if stats is not None else None
+            parsed[filePath] = getHeaderPrototypes(filePath, missing, cache, tokenizer, header_stats)
+        
+        for prototype in parsed[filePath]:
+            if prototype.function_name() in missing:
+                missing.remove(prototype.function_name())
+                prototypes.append(prototype)
+    
+    if cache is not None:
+        cache.save()
+    
+    for fileName, missing in funcsToFind.items():
+        if missing:
+            print('Could not find {0} in {1}'.format(', '.join(missing), fileName))
+    
+    return prototypes
+
+def getHeaderPrototypes(filePath, funcsToFind, cache, tokenizer=tokenize.GetTokens, stats=None):
+    if cache is None:
+        return parseHeader(filePath, funcsToFind, tokenizer=tokenizer, stats=stats)
+    
+    prototypes = cache.get(filePath)
+    if prototypes is None:
+        prototypes, cacheable = parseHeaderForCache(filePath, funcsToFind, tokenizer, stats)
+        if cacheable:
+            cache.put(filePath, prototypes)
+    elif stats is not None:
+        stats['cached'] = True
+    return prototypes
+
+def parseHeadersInParallel(headers, funcsToFind, cache, jobs, tokenizer=tokenize.GetTokens, stats=None):
+    '''
+    Parses every header that is not already cached in a pool of jobs worker
+    processes.  Returns a dict of header path to prototypes; a header whose
+    worker failed is reported and maps to an empty list
+    '''
+    parsed = {}
+    pending = []
+    queued = set()
+    for fileName, filePath in headers:
+        if filePath in parsed or filePath in queued:
+            continue
+        
+        if cache is None:
+            pending.append((fileName, filePath, list(funcsToFind[fileName])))
+            queued.add(filePath)
+            continue
+        
+        prototypes = cache.get(filePath)
+        if prototypes is None:
+            pending.append((fileName, filePath, list(funcsToFind[fileName])))
+            queued.add(filePath)
+        else:
+            parsed[filePath] = prototypes
+            if stats is not None:
+                stats.header(fileName, filePath)['cached'] = True
+    
+    if not pending:
+        return parsed
+    
+    parse = parseHeader if cache is None else parseHeaderForCache
+    worker = parse if stats is None else functools.partial(measureHeader, parse=parse)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [(fileName, filePath, pool.submit(worker, filePath, wanted, tokenizer=tokenizer)) for fileName, filePath, wanted in pending]
+        
+        for fileName, filePath, future in futures:
+            try:
+                prototypes = future.result()
+                if stats is not None:
+                    prototypes, header_stats = prototypes
+                    stats.header(fileName, filePath).update(header_stats)
+            except Exception as err:
+                print('Failed to parse {0}: {1}'.format(filePath, err or type(err).__name__))
+                parsed[filePath] = []
                 continue
-            foundFiles.append(include)
-            source = open(filePath, 'rt').read()
-            builder = ast.BuilderFromSource(source, filePath)
-            entire_ast = filter(None, builder.Generate())
             
-            original_stderr = sys.stderr
-            sys.stderr = NullDevice()
-            for tree in entire_ast:
-                try:
-                    if type(tree) != ast.Function or tree.name not in funcsToFind:
-                        continue
-                    
-                    prototypes.append(FunctionPrototype(tree))
-                except AssertionError:
-                    pass
-                except:
-                    print('I did my best, but I can go no further. Hopefully the collected ASTs are sufficient for your needs')
-            sys.stderr = original_stderr
-    
-    return prototypes, foundFiles
+            if cache is not None:
+                prototypes, cacheable = prototypes
+                if cacheable:
+                    cache.put(filePath, prototypes)
+            parsed[filePath] = prototypes
+    
+    return parsed
+
+def measureHeader(filePath, funcsToFind=None, tokenizer=tokenize.GetTokens, parse=None):
+    '''Returns (result, counters) for parse(filePath, funcsToFind), parseHeader by default'''
+    stats = newHeaderStats()
+    return (parse or parseHeader)(filePath, funcsToFind, tokenizer=tokenizer, stats=stats), stats
+
+def parseHeader(filePath, funcsToFind=None, prescan=True, tokenizer=tokenize.GetTokens, stats=None):
+    '''
+    Returns a FunctionPrototype for each top-level function in filePath
+
+    If funcsToFind is given only those functions are returned, and parsing
+    stops as soon as all of them have been seen.  Unless prescan is False,
+    only the declarations that mention them are parsed; the whole header is
+    parsed if that fails to produce every function the pre-scan saw.
+
+    If stats is given, the time taken and the amounts read and parsed are
+    added to its entries, as created by generationstats.newHeaderStats
+    '''
+    return parseHeaderSource(readHeader(filePath, stats), filePath, funcsToFind, prescan, tokenizer, stats)
+
+def parseHeaderForCache(filePath, funcsToFind, tokenizer=tokenize.GetTokens, stats=None):
+    '''
+    Returns (prototypes, cacheable) where prototypes has every top-level
+    function of filePath, to be cached for any later request.  When parsing
+    the whole header misses some of funcsToFind, they are looked for as
+    parseHeader would, so the functions found do not depend on the cache,
+    and cacheable is False.  It is also False when the parser gave up on
+    the header, since the functions it did not reach would be missing
+    '''
+    source = readHeader(filePath, stats)
+    prototypes, error = parseSource(source, filePath, None, tokenizer, stats)
+    found = set(prototype.function_name() for prototype in prototypes)
+    missing = [name for name in funcsToFind if name not in found]
+    if missing:
+        return prototypes + parseHeaderSource(source, filePath, missing, True, tokenizer, stats), False
+    return prototypes, error is None
+
+def readHeader(filePath, stats=None):
+    start = time.perf_counter()
+    with open(filePath, 'rt') as file:
+        source = file.read()
+    if stats is not None:
+        stats['read'] += time.perf_counter() - start
+        stats['bytes'] += len(source)
+    return source
+
+def parseHeaderSource(source, filePath, funcsToFind=None, prescan=True, tokenizer=tokenize.GetTokens, stats=None):
+    '''Returns the prototypes parseHeader returns for filePath, read as source'''
+    if funcsToFind is not None and prescan:
+        start = time.perf_counter()
+        window, present = extractDeclarations(source, funcsToFind)
+        if stats is not None:
+            stats['prescan'] += time.perf_counter() - start
+        prototypes, error = parseSource(window, filePath, present, tokenizer, stats)
+        if error is None and len(prototypes) == len(present):
+            return prototypes
+        funcsToFind = present
+    
+    prototypes, error = parseSource(source, filePath, funcsToFind, tokenizer, stats)
+    if error is not None and not isinstance(error, AssertionError):
+        print('I did my best, but I can go no further. Hopefully the collected ASTs are sufficient for your needs')
+    
+    return prototypes
+
+def parseSource(source, filePath, funcsToFind=None, tokenizer=tokenize.GetTokens, stats=None):
+    '''
+    Returns (prototypes, error) where error is the exception the AST builder
+    gave up with, if any
+    '''
+    remaining = None
+    name_filter = None
+    if funcsToFind is not None:
+        remaining = set(funcsToFind)
+        name_filter = remaining.__contains__
+    
+    tokens = tokenizer(source)
+    if stats is not None:
+        start = time.perf_counter()
+        tokenize_start = stats['tokenize']
+        tokens = countTokens(tokens, stats)
+    builder = ast.AstBuilder(tokens, filePath, declarations_only=True, name_filter=name_filter)
+    
+    prototypes = []
+    error = None
+    original_stderr = sys.stderr
+    sys.stderr = NullDevice()
+    try:
+        for tree in filter(None, builder.Generate()):
+            if stats is not None:
+                stats['nodes'] += 1
+            if type(tree) != ast.Function:
+                continue
+            if remaining is not None:
+                if tree.name not in remaining:
+                    continue
+                remaining.remove(tree.name)
+            
+            prototypes.append(FunctionPrototype(tree))
+            if remaining is not None and not remaining:
+                break
+    except Exception as err:
+        error = err
+    finally:
+        sys.stderr = original_stderr
+        if stats is not None:
+            tokens.close()
+            stats['parse'] += time.perf_counter() - start - (stats['tokenize'] - tokenize_start)
+    
+    return prototypes, error
 
 def getFullyQualifiedName(namespaces):
     return '::'.join(namespaces)
@@ -231,10 +744,9 @@ def getIncludes(includes):
 def getPathFromNamespace(namespace):
     return '/'.join(namespace.split('::'))
 
-def getNamespaceHierarchy(classes, hierarchy):
+def getNamespaceHierarchy(classes, hierarchy, class_template=texttemplates.CLASS_DECLARATION_TEMPLATE):
     namespaces = hierarchy.split('::')
     ns_template = 'namespace {0}\n'
-    class_template = 'class {0};'
     hierarchy = ''
     
     ident = 0
@@ -258,19 +770,20 @@ def getNamespaceHierarchy(classes, hierarchy):
 def usage():
     print(USAGE + '\n' + DESCRIPTION)
 
-if __name__ == '__main__':
+def parseArguments(argv):
+    '''Returns (function_file, generate keyword arguments) for the command line argv'''
     try:
-        filename = sys.argv[1]
-    except:
+        filename = argv[0]
+    except IndexError:
         usage()
+        sys.exit(2)
     
-    if (len(sys.argv) > 2):
-        try:
-            opts, args = getopt.getopt(sys.argv[2:], 'i:nb:m:c:p:s:', ['include_path=', 'disableGMock', 'base_namespace=', 'mock_namespace=', 'component_namespace=', 'funcPrefix=', 'component_suffix='])
-        except getopt.GetoptError as err:
-            print(err)
-            usage()
-            sys.exit(2)
+    try:
+        opts, args = getopt.getopt(argv[1:], 'i:nb:m:c:p:s:j:f', ['include_path=', 'disableGMock', 'base_namespace=', 'mock_namespace=', 'component_namespace=', 'funcPrefix=', 'component_suffix=', 'no-cache', 'cache-dir=', 'jobs=', 'regex-tokenizer', 'force', 'depfile=', 'watch', 'stats=', 'policy', 'final', 'flat', 'table', 'out-of-line'])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
     
     kwargs = {}
     
@@ -289,5 +802,51 @@ if __name__ == '__main__':
             kwargs['funcPrefix'] = a
         elif o in ('-s', '--component_suffix'):
             kwargs['component_suffix'] = a
+        elif o == '--no-cache':
+            kwargs['use_cache'] = False
+        elif o == '--cache-dir':
+            kwargs['cache_dir'] = a
+        elif o in ('-j', '--jobs'):
+            try:
+                kwargs['jobs'] = int(a)
+            except ValueError:
+                print('jobs must be a number: ' + a)
+                usage()
+                sys.exit(2)
+        elif o == '--regex-tokenizer':
+            kwargs['regex_tokenizer'] = True
+        elif o in ('-f', '--force'):
+            kwargs['force'] = True
+        elif o == '--depfile':
+            kwargs['depfile'] = a
+        elif o == '--watch':
+            kwargs['watch'] = True
+        elif o == '--stats':
+            kwargs['stats_file'] = a
+        elif o == '--policy':
+            kwargs['policy'] = True
+        elif o == '--final':
+            kwargs['final'] = True
+        elif o == '--flat':
+            kwargs['flat'] = True
+        elif o == '--table':
+            kwargs['table'] = True
+        elif o == '--out-of-line':
+            kwargs['out_of_line'] = True
+    
+    try:
+        checkModes(**dict((name, kwargs[name]) for name in MODE_OPTIONS if name in kwargs))
+    except Exception as err:
+        print(err)
+        usage()
+        sys.exit(2)
+    
+    return filename, kwargs
+
+if __name__ == '__main__':
+    filename, kwargs = parseArguments(sys.argv[1:])
     
-    generate(filename, **kwargs)
\ No newline at end of file
+    if kwargs.pop('watch', False):
+        watch(filename, **kwargs)
+    else:
+        generate(filename, **kwargs)
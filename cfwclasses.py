@@ -1,5 +1,7 @@
+import loadpath
 import re
 import texttemplates
+from cpp.ast import FUNCTION_NOEXCEPT
 
 INTERFACE_PREFIX = 'I'
 
@@ -7,6 +9,36 @@ class NullDevice(object):
     def write(self, s):
         pass
 
+_IN_OUT_RE = re.compile('(__(in|out)|(OUT|IN)).*\\s+')
+_IN_OUT_CALL_RE = re.compile(r'__(in|out).*\(.*\)')
+_UNNECESSARY_KEYWORDS_RE = re.compile('(USERENVAPI|WINBASEAPI|WINAPI|__(in|out))')
+_CALLING_CONVENTION_RE = re.compile(r'\b(WINAPIV|WINAPI|APIENTRY|CALLBACK|NTAPI|PASCAL|STDAPICALLTYPE|STDMETHODCALLTYPE|__stdcall|__cdecl|__fastcall|__vectorcall|__thiscall)\b')
+
+ARGS_INDENT = 8
+ARG_NAMES_INDENT = 12
+
+def finalSpecifier(final):
+    '''Returns the text following the name of a class that is final or not'''
+    return ' final' if final else ''
+
+def splitTemplate(template, *args):
+    '''
+    Returns the text of template before and after the field given as None in
+    args, with every other field filled in, so that the text of that field
+    can be written between the two without building it as one string
+    '''
+    marker = '\0'
+    before, separator, after = template.format(*[marker if arg is None else arg for arg in args]).partition(marker)
+    return before, after
+
+def splitTemplateFields(template, *args):
+    '''
+    Returns the list of the texts of template around each of its fields given
+    as None in args, as splitTemplate does for a single field
+    '''
+    marker = '\0'
+    return template.format(*[marker if arg is None else arg for arg in args]).split(marker)
+
 class FunctionArgument(object):
 
     def __init__(self, ast_node):
@@ -30,10 +62,8 @@ class FunctionArgument(object):
         if typeNode.array:
             suffix += '[]'
 
-        in_re = re.compile('(__(in|out)|(OUT|IN)).*\\s+')
-        suffix = in_re.sub('', suffix)
-        in_re2 = re.compile('__(in|out).*\(.*\)')
-        return in_re2.sub('', suffix)
+        suffix = _IN_OUT_RE.sub('', suffix)
+        return _IN_OUT_CALL_RE.sub('', suffix)
 
     def arg_name(self):
         return self.node.name
@@ -41,20 +71,64 @@ class FunctionArgument(object):
     def __str__(self):
         return ' '.join((self.type(), self.arg_name())).strip()
 
+class Signature(object):
+    '''
+    Everything the wrapper templates need from a FunctionPrototype, resolved
+    once and shared by all the classes emitted for it.  Signatures are
+    immutable.
+
+    args and arg_names are the declarations and names of the arguments,
+    already joined the way the templates lay them out.  noexcept is set when
+    the header declares that the function does not throw.
+    calling_convention is the calling convention the header declares the
+    function with, which return_type leaves out, or ''
+    '''
+
+    __slots__ = ('function_name', 'return_type', 'arg_types', 'arg_names', 'noexcept', 'calling_convention', 'arity', 'args', 'arg_names_list')
+
+    def __init__(self, function_name, return_type, arg_types, arg_names, noexcept=False, calling_convention=''):
+        assign = super(Signature, self).__setattr__
+        assign('function_name', function_name)
+        assign('return_type', return_type)
+        assign('arg_types', tuple(arg_types))
+        assign('arg_names', tuple(arg_names))
+        assign('noexcept', noexcept)
+        assign('calling_convention', calling_convention)
+
+        # The parser reads (void) as one argument named void, which is
+        # declared as is but never passed
+        passed = self.arg_names
+        if self.arg_types == ('',) and self.arg_names == ('void',):
+            passed = ()
+        assign('arity', len(passed))
+
+        declarations = [' '.join(arg).strip() for arg in zip(self.arg_types, self.arg_names)]
+        assign('args', (',\n' + ' ' * ARGS_INDENT).join(declarations))
+        assign('arg_names_list', (',\n' + ' ' * ARG_NAMES_INDENT).join(passed))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Signature is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Signature is immutable')
+
+    def __reduce__(self):
+        return (Signature, (self.function_name, self.return_type, self.arg_types, self.arg_names, self.noexcept, self.calling_convention))
+
 class FunctionPrototype(object):
 
     def __init__(self, ast_node):
         self.node = ast_node
+        self._signature = None
 
     def return_type(self):
         return self._sanitizeType(self.node.return_type.name)
 
     def _sanitizeType(self, typeName):
         #return typeName
-        unnecessaryKeywords = re.compile('(USERENVAPI|WINBASEAPI|WINAPI|__(in|out))')
         final = ''
         
-        for token in unnecessaryKeywords.sub('', typeName).split(' '):
+        for token in _UNNECESSARY_KEYWORDS_RE.sub('', typeName).split(' '):
             if len(token.strip()) == 0:
                 continue
             final += token.strip()
@@ -76,6 +150,29 @@ class FunctionPrototype(object):
     def qualifier(self):
         return '' #not yet supported
 
+    def noexcept(self):
+        '''Returns whether the header declares that the function does not throw'''
+        return bool(self.node.modifiers & FUNCTION_NOEXCEPT)
+
+    def calling_convention(self):
+        '''Returns the calling convention the header declares the function with, or an empty string'''
+        return_type = self.node.return_type
+        match = _CALLING_CONVENTION_RE.search(' '.join(return_type.modifiers + [return_type.name]))
+        return match.group(1) if match else ''
+
+    def signature(self):
+        '''Returns the Signature of this prototype, resolving it on first use'''
+        if self._signature is None:
+            args = self.args()
+            self._signature = Signature(
+                self.function_name(),
+                self.return_type(),
+                [arg.type() for arg in args],
+                [arg.arg_name() for arg in args],
+                self.noexcept(),
+                self.calling_convention())
+        return self._signature
+
 class AstHelper(object):
 
     def __init__(self):
@@ -92,102 +189,154 @@ class FunctionWrapper(object):
                  component_namespace='Component',
                  mock_namespace='Mock',
                  funcPrefix='my',
-                 component_suffix='Wrapper'):
+                 component_suffix='Wrapper',
+                 final=False):
         self.prototype = prototype
+        self.signature = prototype.signature()
         self.base_namespace = base_namespace
         self.component_namespace = component_namespace
         self.mock_namespace = mock_namespace
         self.funcPrefix = funcPrefix
         self.component_suffix= component_suffix
+        self.final = final
         self.astHelper = AstHelper()
 
     def interface_name(self):
-        return INTERFACE_PREFIX + self.prototype.function_name()
+        return INTERFACE_PREFIX + self.signature.function_name
 
     def interface_class(self):
-        function = texttemplates.INTERFACE_FUNCTION_TEMPLATE.format(
-        self.prototype.return_type(),
-        self.funcPrefix,
-        self.prototype.function_name(),
-        self.getArgs(),
-        'const')
-        
         return texttemplates.INTERFACE_CLASS_TEMPLATE.format(
             self.astHelper.getFullyQualifiedName((self.base_namespace, self.interface_name())),
-            function,
+            self.interface_function(),
             self.interface_name())
 
-    def getArgs(self, indent=8):
+    def interface_function(self):
+        return texttemplates.INTERFACE_FUNCTION_TEMPLATE.format(
+            self.signature.return_type,
+            self.funcPrefix,
+            self.signature.function_name,
+            self.signature.args,
+            'const')
+
+    def getArgs(self, indent=ARGS_INDENT):
+        if indent == ARGS_INDENT:
+            return self.signature.args
+        
         arglist = []
-        for arg in self.prototype.args():
-            arglist.append(str(arg))
+        for arg in zip(self.signature.arg_types, self.signature.arg_names):
+            arglist.append(' '.join(arg).strip())
         
         base = ',\n' + (' ' * indent)
         return base.join(arglist)
 
     def component_name(self):
-        return self.prototype.function_name() + self.component_suffix
+        return self.signature.function_name + self.component_suffix
 
     def component_class(self):
-        function = texttemplates.COMPONENT_FUNCTION_TEMPLATE.format(
-            self.prototype.return_type(),
-            self.funcPrefix,
-            self.prototype.function_name(),
-            self.getArgs(),
-            'const',
-            self.getArgNames())
-        
         return texttemplates.INHERITING_CLASS_TEMPLATE.format(
-            self.astHelper.getFullyQualifiedName((self.base_namespace, self.component_namespace, self.component_name())),
+            self.astHelper.getFullyQualifiedName((self.base_namespace, self.component_namespace, self.component_name())) + finalSpecifier(self.final),
             self.astHelper.getFullyQualifiedName((self.base_namespace, self.interface_name())),
-            function,
+            self.real_call(),
             self.component_name())
 
-    def getArgNames(self, ident=12):
-        arglist = []
-        for arg in self.prototype.args():
-            arglist.append(arg.arg_name())
+    def getArgNames(self, ident=ARG_NAMES_INDENT):
+        if ident == ARG_NAMES_INDENT:
+            return self.signature.arg_names_list
         
+        # arity leaves out the argument the parser reads (void) as
         base = ',\n' + ' ' * ident
-        return base.join(arglist)
+        return base.join(self.signature.arg_names[:self.signature.arity])
 
     def mock_function(self):
-        numArgs = len(self.prototype.args())
-        mockType = 'MOCK_CONST_METHOD{0}'.format(numArgs)
+        mockType = 'MOCK_CONST_METHOD{0}'.format(self.signature.arity)
         
         return texttemplates.GMOCK_DECLARATION_TEMPLATE.format(
             mockType,
-            self.funcPrefix + self.prototype.function_name(),
-            self.prototype.return_type(),
-            self.getArgs())
+            self.funcPrefix + self.signature.function_name,
+            self.signature.return_type,
+            self.signature.args)
 
     def real_call(self):
         return texttemplates.COMPONENT_FUNCTION_TEMPLATE.format(
-                self.prototype.return_type(),
+                self.signature.return_type,
+                self.funcPrefix,
+                self.signature.function_name,
+                self.signature.args,
+                self.component_qualifier(),
+                self.signature.arg_names_list)
+
+    def component_qualifier(self):
+        '''
+        Returns the qualifiers of the component function.  Final components
+        mark it final, and noexcept if the C function does not throw
+        '''
+        if not self.final:
+            return 'const'
+        if self.signature.noexcept:
+            return 'const noexcept final'
+        return 'const final'
+
+    def component_declaration(self):
+        return texttemplates.COMPONENT_DECLARATION_TEMPLATE.format(
+                self.signature.return_type,
                 self.funcPrefix,
-                self.prototype.function_name(),
-                self.getArgs(),
-                'const',
-                self.getArgNames())
+                self.signature.function_name,
+                self.signature.args,
+                self.component_qualifier())
+
+    def component_definition(self, class_name):
+        '''Returns the out of line definition of the function of the component class_name'''
+        # final can only be given in the declaration
+        qualifier = ' '.join(word for word in self.component_qualifier().split() if word != 'final')
+        
+        return texttemplates.COMPONENT_DEFINITION_TEMPLATE.format(
+                self.signature.return_type,
+                class_name,
+                self.funcPrefix,
+                self.signature.function_name,
+                self.getArgs(4),
+                qualifier,
+                self.getArgNames(8))
+
+    def component_source(self):
+        '''Returns the out of line definition of the function of component_class'''
+        return self.component_definition(
+            self.astHelper.getFullyQualifiedName((self.base_namespace, self.component_namespace, self.component_name())))
+
+class OutOfLineFunctionWrapper(FunctionWrapper):
+    '''
+    FunctionWrapper whose components only declare their functions, so the
+    header holding them stays small.  The definitions are generated apart
+    with component_source and FunctionAggregate.component_source_parts
+    '''
+
+    def real_call(self):
+        return self.component_declaration()
 
 class FunctionAggregate(object):
 
-    def __init__(self, name, base_namespace='', component_suffix='Wrapper', component_namespace='Component', mock_namespace='Mock'):
+    def __init__(self, name, base_namespace='', component_suffix='Wrapper', component_namespace='Component', mock_namespace='Mock', final=False):
         self.name = name
         self.wrappers = []
+        self.missing = []
         self.base_namespace = base_namespace
         self.component_suffix = component_suffix
         self.component_namespace = component_namespace
         self.mock_namespace = mock_namespace
+        self.final = final
         self.astHelper = AstHelper()
 
     def interface_aggregate(self):
+        return ''.join(self.interface_aggregate_parts())
+
+    def interface_aggregate_parts(self):
+        '''Yields the text of interface_aggregate'''
         interfaces = []
     
         for wrapper in self.wrappers:
             interfaces.append(wrapper.interface_name())
         
-        return texttemplates.INHERITING_CLASS_TEMPLATE.format(
+        yield texttemplates.INHERITING_CLASS_TEMPLATE.format(
             self.astHelper.getFullyQualifiedName((self.base_namespace, self.interface_name())),
             ',\n    public '.join(interfaces),
             '',
@@ -197,37 +346,50 @@ class FunctionAggregate(object):
         return INTERFACE_PREFIX + self.component_name()
 
     def component_aggregate(self):
-        functions = ''
-        
-        for wrapper in self.wrappers:
-            functions += wrapper.real_call() + '    '
-        
-        return texttemplates.INHERITING_CLASS_TEMPLATE.format(
-            self.astHelper.getFullyQualifiedName((self.base_namespace, self.component_namespace, self.component_name())),
+        return ''.join(self.component_aggregate_parts())
+
+    def component_aggregate_parts(self):
+        '''Yields the text of component_aggregate one wrapper at a time'''
+        before, after = splitTemplate(texttemplates.INHERITING_CLASS_TEMPLATE,
+            self.astHelper.getFullyQualifiedName((self.base_namespace, self.component_namespace, self.component_name())) + finalSpecifier(self.final),
             self.astHelper.getFullyQualifiedName((self.base_namespace, self.interface_name())),
-            functions,
+            None,
             self.component_name())
+        
+        yield before
+        for wrapper in self.wrappers:
+            yield wrapper.real_call() + '    '
+        yield after
 
     def component_name(self):
         return self.name + self.component_suffix
 
+    def component_source_parts(self):
+        '''Yields the out of line definitions of the functions of component_aggregate'''
+        component = self.astHelper.getFullyQualifiedName((self.base_namespace, self.component_namespace, self.component_name()))
+        for wrapper in self.wrappers:
+            yield wrapper.component_definition(component)
+
     def mock_aggregate(self):
+        return ''.join(self.mock_aggregate_parts())
+
+    def mock_aggregate_parts(self):
+        '''Yields the text of mock_aggregate one wrapper at a time'''
         hierarchy = self.astHelper.getFullyQualifiedName((self.base_namespace, self.mock_namespace))
+        before, after = splitTemplate(texttemplates.INHERITING_CLASS_TEMPLATE,
+            hierarchy+'::'+self.component_name(),
+            self.base_namespace+'::'+self.interface_name(),
+            None,
+            self.component_name())
         
-        return self.getNamespaces(hierarchy, (self.component_name(),)) + '\n\n' + \
-            texttemplates.INHERITING_CLASS_TEMPLATE.format(
-                hierarchy+'::'+self.component_name(),
-                self.base_namespace+'::'+self.interface_name(),
-                self.mock_functions(),
-                self.component_name())
+        yield self.getNamespaces(hierarchy, (self.component_name(),)) + '\n\n'
+        yield before
+        for wrapper in self.wrappers:
+            yield wrapper.mock_function() + ' ' * 4
+        yield after
 
     def mock_functions(self):
-        functions = ''
-
-        for wrapper in self.wrappers:
-            functions += wrapper.mock_function() + ' ' * 4
-        
-        return functions
+        return ''.join(wrapper.mock_function() + ' ' * 4 for wrapper in self.wrappers)
 
     def getNamespaces(self, full_hierarchy, classes):
         namespaces = full_hierarchy.split('::')
@@ -251,4 +413,221 @@ class FunctionAggregate(object):
             hierarchy += ' ' * (ident) + '}\n'
             ident -= tab
         
-        return hierarchy
\ No newline at end of file
+        return hierarchy
+
+class FlatFunctionAggregate(FunctionAggregate):
+    '''
+    FunctionAggregate whose interface declares the functions of all its
+    wrappers itself instead of inheriting the interface of each, so objects
+    implementing it hold a single virtual table pointer.  The interfaces of
+    the functions named in narrow are still inherited, so that the
+    aggregate can be passed where one of them is expected
+    '''
+
+    def __init__(self, name, base_namespace='', component_suffix='Wrapper', component_namespace='Component', mock_namespace='Mock', final=False, narrow=()):
+        FunctionAggregate.__init__(self, name, base_namespace, component_suffix, component_namespace, mock_namespace, final)
+        self.narrow = frozenset(narrow)
+
+    def interface_aggregate_parts(self):
+        interfaces = [wrapper.interface_name() for wrapper in self.wrappers if wrapper.signature.function_name in self.narrow]
+        name = self.astHelper.getFullyQualifiedName((self.base_namespace, self.interface_name()))
+        
+        if interfaces:
+            before, after = splitTemplate(texttemplates.INHERITING_CLASS_TEMPLATE,
+                name,
+                ',\n    public '.join(interfaces),
+                None,
+                self.interface_name())
+        else:
+            before, after = splitTemplate(texttemplates.INTERFACE_CLASS_TEMPLATE,
+                name,
+                None,
+                self.interface_name())
+        
+        yield before
+        for wrapper in self.wrappers:
+            if wrapper.signature.function_name not in self.narrow:
+                yield wrapper.interface_function() + '\n\n    '
+        yield after
+
+def bindPolicy(interface, implementation):
+    '''Returns the interface class template interface bound to implementation'''
+    return '{0}<{1}>'.format(interface, implementation)
+
+class PolicyFunctionWrapper(FunctionWrapper):
+    '''
+    FunctionWrapper generating statically bound classes.  The interface is a
+    class template forwarding each call to the class it is bound to, and the
+    component derives from the interface bound to itself without any virtual
+    function, so calls through the interface can be inlined
+    '''
+
+    def interface_class(self):
+        function = texttemplates.POLICY_FUNCTION_TEMPLATE.format(
+            self.signature.return_type,
+            self.funcPrefix,
+            self.signature.function_name,
+            self.signature.args,
+            'const',
+            self.signature.arg_names_list)
+        
+        return texttemplates.POLICY_INTERFACE_CLASS_TEMPLATE.format(
+            self.astHelper.getFullyQualifiedName((self.base_namespace, self.interface_name())),
+            function,
+            self.interface_name())
+
+    def component_class(self):
+        component = self.astHelper.getFullyQualifiedName((self.base_namespace, self.component_namespace, self.component_name()))
+        
+        return texttemplates.POLICY_INHERITING_CLASS_TEMPLATE.format(
+            component + finalSpecifier(self.final),
+            bindPolicy(self.astHelper.getFullyQualifiedName((self.base_namespace, self.interface_name())), component),
+            self.real_call())
+
+    def component_qualifier(self):
+        # The functions are not virtual, so only the class can be final
+        if self.final and self.signature.noexcept:
+            return 'const noexcept'
+        return 'const'
+
+class PolicyFunctionAggregate(FunctionAggregate):
+    '''
+    FunctionAggregate generating statically bound classes.  The mock derives
+    from the interface bound to itself, like the component, so code written
+    against the interface bound to a template parameter can be tested with it
+    '''
+
+    def interface_aggregate_parts(self):
+        interfaces = [bindPolicy(wrapper.interface_name(), 'Implementation') for wrapper in self.wrappers]
+        
+        yield texttemplates.POLICY_INHERITING_INTERFACE_TEMPLATE.format(
+            self.astHelper.getFullyQualifiedName((self.base_namespace, self.interface_name())),
+            ',\n    public '.join(interfaces),
+            self.interface_name())
+
+    def component_aggregate_parts(self):
+        component = self.astHelper.getFullyQualifiedName((self.base_namespace, self.component_namespace, self.component_name()))
+        before, after = splitTemplate(texttemplates.POLICY_INHERITING_CLASS_TEMPLATE,
+            component + finalSpecifier(self.final),
+            bindPolicy(self.astHelper.getFullyQualifiedName((self.base_namespace, self.interface_name())), component),
+            None)
+        
+        yield before
+        for wrapper in self.wrappers:
+            yield wrapper.real_call() + '    '
+        yield after
+
+    def mock_aggregate_parts(self):
+        hierarchy = self.astHelper.getFullyQualifiedName((self.base_namespace, self.mock_namespace))
+        mock = hierarchy+'::'+self.component_name()
+        before, after = splitTemplate(texttemplates.POLICY_INHERITING_CLASS_TEMPLATE,
+            mock,
+            bindPolicy(self.base_namespace+'::'+self.interface_name(), mock),
+            None)
+        
+        yield self.getNamespaces(hierarchy, (self.component_name(),)) + '\n\n'
+        yield before
+        for wrapper in self.wrappers:
+            yield wrapper.mock_function() + ' ' * 4
+        yield after
+
+class TableFunctionWrapper(FunctionWrapper):
+    '''
+    FunctionWrapper for function pointer tables.  Functions are only called
+    through the table of an aggregate, so no class is generated for each of
+    them
+    '''
+
+    def interface_class(self):
+        return ''
+
+    def component_class(self):
+        return ''
+
+    def calling_convention(self):
+        '''Returns the calling convention of the function followed by a space, or an empty string'''
+        return self.signature.calling_convention + ' ' if self.signature.calling_convention else ''
+
+    def table_field(self):
+        return texttemplates.TABLE_FIELD_TEMPLATE.format(
+            self.signature.return_type,
+            self.funcPrefix,
+            self.signature.function_name,
+            self.signature.args,
+            self.calling_convention())
+
+    def table_entry(self):
+        return '&' + self.signature.function_name
+
+    def forwarding_name(self):
+        return 'forward_' + self.funcPrefix + self.signature.function_name
+
+    def forwarding_assignment(self):
+        return 'table.{0}{1} = &{2};'.format(self.funcPrefix, self.signature.function_name, self.forwarding_name())
+
+    def forwarding_function(self):
+        return texttemplates.TABLE_FORWARDING_TEMPLATE.format(
+            self.signature.return_type,
+            self.funcPrefix,
+            self.signature.function_name,
+            self.signature.args,
+            self.signature.arg_names_list,
+            self.calling_convention())
+
+class TableFunctionAggregate(FunctionAggregate):
+    '''
+    FunctionAggregate generating a plain struct of pointers to the functions
+    of its TableFunctionWrappers instead of classes.  The component is a
+    function returning the table of the real C functions, and the mock fills
+    a table with functions forwarding to it, so whole aggregates are swapped
+    by assigning tables and each call is a single indirect call
+    '''
+
+    def interface_aggregate_parts(self):
+        before, after = splitTemplate(texttemplates.TABLE_STRUCT_TEMPLATE,
+            self.astHelper.getFullyQualifiedName((self.base_namespace, self.interface_name())),
+            None)
+        
+        yield before
+        for position, wrapper in enumerate(self.wrappers):
+            if position:
+                yield '\n    '
+            yield wrapper.table_field()
+        yield after
+
+    def component_aggregate_parts(self):
+        before, after = splitTemplate(texttemplates.TABLE_COMPONENT_TEMPLATE,
+            self.astHelper.getFullyQualifiedName((self.base_namespace, self.interface_name())),
+            self.astHelper.getFullyQualifiedName((self.base_namespace, self.component_namespace, self.component_name())),
+            None)
+        
+        yield before
+        for position, wrapper in enumerate(self.wrappers):
+            if position:
+                yield ',\n        '
+            yield wrapper.table_entry()
+        yield after
+
+    def mock_aggregate_parts(self):
+        hierarchy = self.astHelper.getFullyQualifiedName((self.base_namespace, self.mock_namespace))
+        head, fill, forwarding, tail = splitTemplateFields(texttemplates.TABLE_MOCK_TEMPLATE,
+            hierarchy+'::'+self.component_name(),
+            self.base_namespace+'::'+self.interface_name(),
+            None,
+            None,
+            None,
+            self.component_name())
+        
+        yield self.getNamespaces(hierarchy, (self.component_name(),)) + '\n\n'
+        yield head
+        for wrapper in self.wrappers:
+            yield wrapper.mock_function() + ' ' * 4
+        yield fill
+        for position, wrapper in enumerate(self.wrappers):
+            if position:
+                yield '\n        '
+            yield wrapper.forwarding_assignment()
+        yield forwarding
+        for wrapper in self.wrappers:
+            yield wrapper.forwarding_function() + ' ' * 4
+        yield tail
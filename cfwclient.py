@@ -0,0 +1,98 @@
+import json
+import os
+import socket
+import sys
+
+'''
+Where cfwserver.py listens unless told otherwise: a Unix domain socket in
+the temp directory where they are supported, and a port on the loopback
+interface elsewhere, so only local processes can connect
+'''
+if hasattr(socket, 'AF_UNIX'):
+    DEFAULT_ADDRESS = os.path.join(os.environ.get('TMPDIR', '/tmp'), 'cfunctionwrapper-{0}.sock'.format(os.getuid()))
+else:
+    DEFAULT_ADDRESS = 'localhost:5741'
+
+ADDRESS_VAR = 'CFW_SERVER'
+
+USAGE = 'Usage:\n\n' + __file__ + ''' functionList [cfunctionwrapper.py options]'''
+
+DESCRIPTION = '''
+Generate C++ C-function wrapper classes through a running cfwserver.py
+
+Takes the same arguments as cfunctionwrapper.py and prints the same output,
+but the generation runs in the server, which keeps the Python modules
+loaded and the headers it parsed in memory between requests.  If no server
+is running the wrappers are generated by this process instead.
+
+The server is found at the address in the CFW_SERVER environment variable,
+or at the default address of cfwserver.py
+'''
+
+def getAddress():
+    return os.environ.get(ADDRESS_VAR, DEFAULT_ADDRESS)
+
+def parseAddress(address):
+    '''Returns (socket family, socket address) for a host:port or socket path'''
+    host, separator, port = address.rpartition(':')
+    if not hasattr(socket, 'AF_UNIX') or (separator and port.isdigit() and os.sep not in address):
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+def readMessage(connection):
+    '''Returns the JSON message sent on connection up to its end of file'''
+    chunks = []
+    while True:
+        chunk = connection.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return json.loads(b''.join(chunks).decode('utf-8'))
+
+def sendMessage(connection, message):
+    connection.sendall(json.dumps(message).encode('utf-8'))
+    connection.shutdown(socket.SHUT_WR)
+
+def request(argv, address=None):
+    '''
+    Asks the server at address to run cfunctionwrapper.py with the command
+    line argv in the current directory.  Returns (exit status, output, list
+    of generated files), or None if no server is listening
+    '''
+    family, address = parseAddress(address or getAddress())
+    connection = socket.socket(family, socket.SOCK_STREAM)
+    with connection:
+        try:
+            connection.connect(address)
+        except OSError:
+            return None
+
+        sendMessage(connection, {
+            'cwd': os.getcwd(),
+            'argv': list(argv),
+            'include': os.environ.get('INCLUDE')})
+        response = readMessage(connection)
+
+    return response['status'], response['output'], response['outputs']
+
+def usage():
+    print(USAGE + '\n' + DESCRIPTION)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        usage()
+        sys.exit(2)
+
+    response = request(sys.argv[1:])
+    if response is None:
+        import cfunctionwrapper
+        filename, kwargs = cfunctionwrapper.parseArguments(sys.argv[1:])
+        if kwargs.pop('watch', False):
+            cfunctionwrapper.watch(filename, **kwargs)
+        else:
+            cfunctionwrapper.generate(filename, **kwargs)
+        sys.exit(0)
+
+    status, output, outputs = response
+    sys.stdout.write(output)
+    sys.exit(status)
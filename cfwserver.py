@@ -0,0 +1,124 @@
+import loadpath
+import getopt
+import io
+import os
+import socket
+import sys
+import traceback
+import cfunctionwrapper
+from cfwclient import getAddress, parseAddress, readMessage, sendMessage
+from prototypecache import PrototypeCache, MemoryCache, DEFAULT_CACHE_DIR
+
+USAGE = 'Usage:\n\n' + __file__ + ''' [-a address]'''
+
+DESCRIPTION = '''
+Serve wrapper generation requests from cfwclient.py
+
+Runs until interrupted, answering one request at a time.  The prototypes of
+every header parsed for a request are kept in memory, so later requests only
+parse headers that changed since
+
+address                 [Default: The CFW_SERVER environment variable, or else a
+                        Unix domain socket in the temp directory, or
+                        localhost:5741 where those are not supported] Socket
+                        path or host:port to listen on
+'''
+
+class GenerationServer(object):
+    '''
+    Runs cfunctionwrapper.generate for clients, keeping the parsed headers
+    of each prototype cache configuration in a MemoryCache between requests
+    '''
+
+    def __init__(self, address):
+        self.address = address
+        self.requests = 0
+        self._caches = {}
+
+    def serve(self):
+        family, address = parseAddress(self.address)
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        with listener:
+            if family == socket.AF_INET:
+                listener.bind(address)
+            else:
+                if os.path.exists(address):
+                    os.remove(address)
+                # Only the user running the server may connect to its socket
+                umask = os.umask(0o077)
+                try:
+                    listener.bind(address)
+                finally:
+                    os.umask(umask)
+
+            listener.listen(16)
+            print('Listening on {0}'.format(self.address))
+
+            while True:
+                connection, peer = listener.accept()
+                with connection:
+                    try:
+                        sendMessage(connection, self.handle(readMessage(connection)))
+                    except (OSError, ValueError):
+                        pass
+
+    def handle(self, request):
+        '''Returns the response to a request sent by cfwclient.request'''
+        self.requests += 1
+        output = io.StringIO()
+        outputs = []
+        status = 0
+
+        original_stdout = sys.stdout
+        original_cwd = os.getcwd()
+        sys.stdout = output
+        try:
+            os.chdir(request['cwd'])
+            filename, kwargs = cfunctionwrapper.parseArguments(request['argv'])
+            if kwargs.pop('watch', False):
+                raise Exception('--watch cannot be used through the server')
+
+            if not kwargs.get('include_path'):
+                kwargs['include_path'] = request['include'] or cfunctionwrapper.getIncludeEnvVar()
+            kwargs['cache'] = self.getCache(kwargs.pop('use_cache', True), kwargs.pop('cache_dir', DEFAULT_CACHE_DIR))
+
+            outputs = cfunctionwrapper.generate(filename, **kwargs)
+        except SystemExit as err:
+            status = err.code if isinstance(err.code, int) else 1
+        except Exception:
+            traceback.print_exc(file=output)
+            status = 1
+        finally:
+            sys.stdout = original_stdout
+            os.chdir(original_cwd)
+
+        return {'status': status, 'output': output.getvalue(), 'outputs': outputs}
+
+    def getCache(self, use_cache, cache_dir):
+        key = os.path.abspath(cache_dir) if use_cache else None
+        cache = self._caches.get(key)
+        if cache is None:
+            cache = MemoryCache(PrototypeCache(key) if use_cache else None)
+            self._caches[key] = cache
+        return cache
+
+def usage():
+    print(USAGE + '\n' + DESCRIPTION)
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'a:', ['address='])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+
+    address = getAddress()
+    for o, a in opts:
+        if o in ('-a', '--address'):
+            address = a
+
+    try:
+        GenerationServer(address).serve()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,149 @@
+import loadpath
+import getopt
+import io
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+import cfunctionwrapper
+from policybenchmark import DEFAULT_COMPILE_COMMAND
+
+USAGE = 'Usage:\n\n' + __file__ + ''' [-f function_file] [-i include_path] [-o directory]
+        [-c compile_command] [-u units] [--no-run]'''
+
+DESCRIPTION = '''
+Compare the time taken to compile code using the components when their
+functions are defined in the component header and with --out-of-line
+
+Generates the wrappers of function_file both ways, and units source files
+each using MasterCWrapper, as the files of a project calling the wrapped
+functions would.  Every file is then compiled on its own, and the total
+time taken by the units and by the generated sources of each way is
+printed; only --out-of-line generates sources
+
+function_file           [Default: cfunctions.txt next to this script] Function
+                        file of the wrappers
+include_path            [Default: The INCLUDE environment variable] C compiler
+                        include path, as given to cfunctionwrapper.py
+directory               [Default: A temporary directory] Directory the wrappers,
+                        the sources and their objects are written to
+compile_command         [Default: cl.exe /nologo /EHsc /O2 on Windows, else the
+                        CXX environment variable or c++, with -O2] Command
+                        compiling a C++ source file
+units                   [Default: 20] Number of source files using the wrappers
+
+--no-run = Only write the wrappers and the sources
+'''
+
+DEFAULT_UNITS = 20
+
+'''The base namespace of the wrappers generated each way, and whether it is out of line'''
+VARIANTS = (('Inline', False), ('OutOfLine', True))
+
+'''
+A source file using the wrappers
+
+{0} = Base namespace
+{1} = Number of the unit
+'''
+UNIT_TEMPLATE = '''#include <{0}/Component/CWrappers.h>
+
+const {0}::IMasterCWrapper& unit{1}()
+{{
+    static {0}::Component::MasterCWrapper wrapper;
+    return wrapper;
+}}
+'''
+
+def writeSources(directory, function_file, include_path='', units=DEFAULT_UNITS):
+    '''
+    Writes the wrappers of function_file each way and the units using them
+    into directory.  Returns (base namespace, paths of the generated sources,
+    paths of the units) for each way
+    '''
+    cwd = os.getcwd()
+    original_stdout = sys.stdout
+    os.chdir(directory)
+    sys.stdout = io.StringIO()
+    try:
+        variants = []
+        for namespace, out_of_line in VARIANTS:
+            outputs = cfunctionwrapper.generate(function_file, include_path, generateGmock=False,
+                base_namespace=namespace, use_cache=False, force=True, out_of_line=out_of_line)
+            variants.append((namespace, [os.path.join(directory, path) for path in outputs if path.endswith('.cpp')], []))
+    finally:
+        sys.stdout = original_stdout
+        os.chdir(cwd)
+
+    for namespace, generated, sources in variants:
+        for unit in range(units):
+            source = os.path.join(directory, '{0}Unit{1}.cpp'.format(namespace, unit))
+            with open(source, 'wt') as file:
+                file.write(UNIT_TEMPLATE.format(namespace, unit))
+            sources.append(source)
+    return variants
+
+def getObjectArguments(compile_command, directory, source, obj):
+    include_dirs = (directory, os.path.join(directory, cfunctionwrapper.BASE_INCLUDE))
+    arguments = shlex.split(compile_command, posix=os.name != 'nt')
+    if os.name == 'nt':
+        return arguments + ['/c'] + ['/I' + path for path in include_dirs] + [source, '/Fo' + obj]
+    return arguments + ['-c'] + ['-I' + path for path in include_dirs] + [source, '-o', obj]
+
+def timeCompiles(compile_command, directory, sources):
+    '''Returns the total wall time in seconds of compiling each of sources on its own'''
+    total = 0.0
+    for source in sources:
+        obj = os.path.splitext(source)[0] + ('.obj' if os.name == 'nt' else '.o')
+        start = time.perf_counter()
+        subprocess.check_call(getObjectArguments(compile_command, directory, source, obj), cwd=directory)
+        total += time.perf_counter() - start
+    return total
+
+def usage():
+    print(USAGE + '\n' + DESCRIPTION)
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'f:i:o:c:u:', ['functions=', 'include_path=', 'output=', 'compile=', 'units=', 'no-run'])
+        function_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cfunctions.txt')
+        include_path = ''
+        directory = None
+        compile_command = DEFAULT_COMPILE_COMMAND
+        units = DEFAULT_UNITS
+        run = True
+        for o, a in opts:
+            if o in ('-f', '--functions'):
+                function_file = os.path.abspath(a)
+            elif o in ('-i', '--include_path'):
+                include_path = a
+            elif o in ('-o', '--output'):
+                directory = os.path.abspath(a)
+            elif o in ('-c', '--compile'):
+                compile_command = a
+            elif o in ('-u', '--units'):
+                units = int(a)
+            elif o == '--no-run':
+                run = False
+    except (getopt.GetoptError, ValueError) as err:
+        print(err)
+        usage()
+        sys.exit(2)
+
+    if directory is None:
+        directory = tempfile.mkdtemp()
+    elif not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    variants = writeSources(directory, function_file, include_path, units)
+    print('Wrote {0}'.format(directory))
+    if not run:
+        sys.exit(0)
+
+    for namespace, generated, sources in variants:
+        seconds = timeCompiles(compile_command, directory, sources)
+        generated_seconds = timeCompiles(compile_command, directory, generated)
+        print('{0:<10} {1:>4} units {2:8.2f} s {3:>4} generated sources {4:8.2f} s total {5:8.2f} s'.format(
+            namespace, len(sources), seconds, len(generated), generated_seconds, seconds + generated_seconds))
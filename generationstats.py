@@ -0,0 +1,110 @@
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+'''Bump whenever a field of the stats file is renamed or changes meaning'''
+STATS_VERSION = 1
+
+def newHeaderStats():
+    '''Returns the counters parseHeader fills in for one header'''
+    return {
+        'bytes': 0,
+        'read': 0.0,
+        'prescan': 0.0,
+        'tokenize': 0.0,
+        'parse': 0.0,
+        'tokens': 0,
+        'nodes': 0}
+
+def countTokens(tokens, stats):
+    '''
+    Yields tokens, adding their number and the time spent producing them to
+    the tokens and tokenize entries of stats
+    '''
+    clock = time.perf_counter
+    tokens = iter(tokens)
+    count = 0
+    elapsed = 0.0
+    try:
+        while True:
+            start = clock()
+            try:
+                token = next(tokens)
+            except StopIteration:
+                elapsed += clock() - start
+                return
+            elapsed += clock() - start
+            count += 1
+            yield token
+    finally:
+        stats['tokens'] += count
+        stats['tokenize'] += elapsed
+
+def getPeakMemory():
+    '''Returns the peak resident size in bytes of this process and its workers, or None if unknown'''
+    if resource is None:
+        return None
+
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class GenerationStats(object):
+    '''
+    Wall times and counters of one generate() run, written as JSON.
+
+    Times are in seconds.  stages holds the time spent in each phase of
+    generate(); headers has the size, read, pre-scan, tokenize and parse
+    times and token and top-level AST node counts of every header, with
+    cached set for headers whose prototypes came from a cache; aggregates
+    has the time spent generating each aggregate's classes and the function
+    names it lists that matched no wrapper, and outputs the size of each
+    generated file and whether it had to be written
+    '''
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.headers = []
+        self.aggregates = []
+        self.outputs = []
+        self._stage_start = self.start
+
+    def endStage(self, name):
+        '''Records the time since the previous stage ended as the time of stage name'''
+        now = time.perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + now - self._stage_start
+        self._stage_start = now
+
+    def header(self, fileName, filePath):
+        '''Returns the counters of a newly parsed header, to be filled in'''
+        stats = newHeaderStats()
+        stats.update({'header': fileName, 'path': filePath, 'cached': False})
+        self.headers.append(stats)
+        return stats
+
+    def aggregate(self, name, functions, seconds, missing=()):
+        self.aggregates.append({'name': name, 'functions': functions, 'seconds': seconds, 'missing': list(missing)})
+
+    def output(self, filePath, size, written):
+        self.outputs.append({'path': filePath, 'bytes': size, 'written': written})
+
+    def save(self, filePath):
+        with open(filePath, 'wt') as file:
+            json.dump({
+                'version': STATS_VERSION,
+                'seconds': time.perf_counter() - self.start,
+                'stages': self.stages,
+                'headers': self.headers,
+                'aggregates': self.aggregates,
+                'outputs': self.outputs,
+                'bytes_read': sum(stats['bytes'] for stats in self.headers),
+                'bytes_written': sum(output['bytes'] for output in self.outputs if output['written']),
+                'peak_memory': getPeakMemory()}, file, indent=1, sort_keys=True)
@@ -39,6 +39,7 @@ except ImportError:
     # Python 2.x
     import __builtin__ as builtins
 
+import itertools
 import sys
 import traceback
 
@@ -70,6 +71,11 @@ FUNCTION_DTOR = 0x10
 FUNCTION_ATTRIBUTE = 0x20
 FUNCTION_UNKNOWN_ANNOTATION = 0x40
 FUNCTION_THROW = 0x80
+FUNCTION_NOEXCEPT = 0x100
+
+# Annotation macros declaring that a function does not throw.
+NOTHROW_ANNOTATIONS = frozenset(('__THROW', '__THROWNL', '_NOEXCEPT', '__NOEXCEPT'))
+NOTHROW_ATTRIBUTES = frozenset(('nothrow', '__nothrow__'))
 
 """
 These are currently unused.  Should really handle these properly at some point.
@@ -674,13 +680,23 @@ class TypeConverter(object):
 
 class AstBuilder(object):
     def __init__(self, token_stream, filename, in_class='', visibility=None,
-                 namespace_stack=[]):
-        self.tokens = token_stream
+                 namespace_stack=[], declarations_only=False, name_filter=None):
+        self.tokens = iter(token_stream)
+        # Tokens are read from the stream a chunk at a time into a buffer
+        # that is indexed by a cursor.  Peeking, putting tokens back and
+        # resetting to a mark only move the cursor, rather than shifting a
+        # queue.  Tokens before the cursor are dropped by _TrimTokens().
+        self.token_buffer = []
+        self.token_index = 0
+        self.token_error = None
         self.filename = filename
-        # TODO(nnorwitz): use a better data structure (deque) for the queue.
-        # Switching directions of the "queue" improved perf by about 25%.
-        # Using a deque should be even better since we access from both sides.
-        self.token_queue = []
+        # Only build the nodes for declarations.  Function bodies, class
+        # bodies and enum/struct/union fields are skipped and left empty.
+        self.declarations_only = declarations_only
+        # If set, functions, methods, variables, typedefs and macros are
+        # only returned if their name passes name_filter(name).  The others are
+        # skipped before their types and parameters are converted.
+        self.name_filter = name_filter
         self.namespace_stack = namespace_stack[:]
         self.in_class = in_class
         if in_class is None:
@@ -696,7 +712,7 @@ class AstBuilder(object):
         self.converter = TypeConverter(self.namespace_stack)
 
     def HandleError(self, msg, token):
-        printable_queue = list(reversed(self.token_queue[-20:]))
+        printable_queue = self.token_buffer[self.token_index:self.token_index+20]
         sys.stderr.write('Got %s in %s @ %s %s\n' %
                          (msg, self.filename, token, printable_queue))
 
@@ -717,11 +733,13 @@ class AstBuilder(object):
 
             try:
                 result = self._GenerateOne(token)
-                if result is not None:
-                    yield result
             except:
                 self.HandleError('exception', token)
                 raise
+            # Nothing before a top-level declaration is ever read again.
+            self._TrimTokens()
+            if result is not None:
+                yield result
 
     def _CreateVariable(self, pos_token, name, type_name, type_modifiers,
                         ref_pointer_name_seq, templated_types, value=None):
@@ -744,8 +762,7 @@ class AstBuilder(object):
                 # The token name is the same as the class, must be a ctor if
                 # there is a paren.  Otherwise, it's the return type.
                 # Peek ahead to get the next token to figure out which.
-                next = self._GetNextToken()
-                self._AddBackToken(next)
+                next = self._PeekToken()
                 if next.token_type == tokenize.SYNTAX and next.name == '(':
                     return self._GetMethod([token], FUNCTION_CTOR, None, True)
                 # Fall through--handle like any other method.
@@ -764,6 +781,12 @@ class AstBuilder(object):
                     temp_tokens.append(last_token)
                     temp_tokens.extend(new_temp)
                     last_token = tokenize.Token(tokenize.SYNTAX, ';', 0, 0)
+            elif last_token.name == '{' and temp_tokens[-1].name == '=':
+                # A brace initializer, this is data, not a method.
+                new_temp = self._GetTokensUpTo(tokenize.SYNTAX, ';')
+                temp_tokens.append(last_token)
+                temp_tokens.extend(new_temp)
+                last_token = tokenize.Token(tokenize.SYNTAX, ';', 0, 0)
 
             if last_token.name == '[':
                 # Handle array, this isn't a method, unless it's an operator.
@@ -779,6 +802,9 @@ class AstBuilder(object):
 
             if last_token.name == ';':
                 # Handle data, this isn't a method.
+                if self.name_filter is not None and not [
+                        t for t in temp_tokens if self.name_filter(t.name)]:
+                    return None
                 parts = self.converter.DeclarationToParts(temp_tokens, True)
                 (name, type_name, templated_types, modifiers, default,
                  unused_other_tokens) = parts
@@ -792,8 +818,8 @@ class AstBuilder(object):
                 return self._CreateVariable(t0, name, type_name, modifiers,
                                             names, templated_types, default)
             if last_token.name == '{':
-                self._AddBackTokens(temp_tokens[1:])
                 self._AddBackToken(last_token)
+                self._AddBackTokens(temp_tokens[1:])
                 method_name = temp_tokens[0].name
                 method = getattr(self, 'handle_' + method_name, None)
                 if not method:
@@ -833,11 +859,12 @@ class AstBuilder(object):
                 name = name[6:].strip()
                 assert name
                 value = ''
-                for i, c in enumerate(name):
-                    if c.isspace():
-                        value = name[i:].lstrip()
-                        name = name[:i]
-                        break
+                parts = name.split(None, 1)
+                if len(parts) == 2:
+                    name, value = parts
+                if (self.name_filter is not None and
+                    not self.name_filter(name)):
+                    return None
                 return Define(token.start, token.end, name, value)
             if name.startswith('if') and name[2:3].isspace():
                 condition = name[3:].strip()
@@ -901,28 +928,84 @@ class AstBuilder(object):
     def GetScope(self):
         return self._GetMatchingChar('{', '}')
 
+    def _SkipScope(self):
+        """Consumes the tokens up to the } that matches the current {."""
+        # Same as exhausting GetScope(), but scans the buffer directly
+        # instead of resuming a generator for every token.
+        count = 1
+        while 1:
+            buffer = self.token_buffer
+            for index in range(self.token_index, len(buffer)):
+                name = buffer[index].name
+                if name == '{':
+                    count += 1
+                elif name == '}':
+                    count -= 1
+                    if count == 0:
+                        self.token_index = index + 1
+                        return
+            self.token_index = len(buffer)
+            if not self._ReadTokens():
+                return
+
     def _GetNextToken(self):
-        if self.token_queue:
-            return self.token_queue.pop()
-        return next(self.tokens)
+        try:
+            token = self.token_buffer[self.token_index]
+        except IndexError:
+            if not self._ReadTokens():
+                return None
+            token = self.token_buffer[self.token_index]
+        self.token_index += 1
+        return token
+
+    def _ReadTokens(self):
+        """Adds the next chunk of the stream to the buffer.
+
+        Returns False at the end of the stream.  An error raised by the
+        stream is raised again once the tokens before it have been read.
+        """
+        if self.token_error is not None:
+            raise self.token_error
+        count = len(self.token_buffer)
+        try:
+            self.token_buffer.extend(itertools.islice(self.tokens, 256))
+        except Exception as e:
+            if len(self.token_buffer) == count:
+                raise
+            self.token_error = e
+        return len(self.token_buffer) > count
+
+    def _PeekToken(self):
+        token = self._GetNextToken()
+        if token is not None:
+            self.token_index -= 1
+        return token
 
     def _AddBackToken(self, token):
-        if token.whence == tokenize.WHENCE_STREAM:
-            token.whence = tokenize.WHENCE_QUEUE
-            self.token_queue.insert(0, token)
+        if self.token_index:
+            self.token_index -= 1
+            self.token_buffer[self.token_index] = token
         else:
-            assert token.whence == tokenize.WHENCE_QUEUE, token
-            self.token_queue.append(token)
+            self.token_buffer.insert(0, token)
 
     def _AddBackTokens(self, tokens):
-        if tokens:
-            if tokens[-1].whence == tokenize.WHENCE_STREAM:
-                for token in tokens:
-                    token.whence = tokenize.WHENCE_QUEUE
-                self.token_queue[:0] = reversed(tokens)
-            else:
-                assert tokens[-1].whence == tokenize.WHENCE_QUEUE, tokens
-                self.token_queue.extend(reversed(tokens))
+        start = max(self.token_index - len(tokens), 0)
+        self.token_buffer[start:self.token_index] = tokens
+        self.token_index = start
+
+    def _MarkTokens(self):
+        """Returns the cursor position to pass to _ResetTokens()."""
+        return self.token_index
+
+    def _ResetTokens(self, mark):
+        self.token_index = mark
+
+    def _TrimTokens(self):
+        # Only trim once at least half of the buffer has been read, so a
+        # large block of tokens that was put back is not shifted repeatedly.
+        if self.token_index * 2 >= len(self.token_buffer):
+            del self.token_buffer[:self.token_index]
+            self.token_index = 0
 
     def GetName(self, seq=None):
         """Returns ([tokens], next_token_info)."""
@@ -1019,18 +1102,32 @@ class AstBuilder(object):
                 modifiers |= FUNCTION_ATTRIBUTE
                 assert token.name == '(', token
                 # Consume everything between the (parens).
-                unused_tokens = list(self._GetMatchingChar('(', ')'))
+                attribute_tokens = list(self._GetMatchingChar('(', ')'))
+                if NOTHROW_ATTRIBUTES.intersection(t.name for t in attribute_tokens):
+                    modifiers |= FUNCTION_NOEXCEPT
                 token = self._GetNextToken()
             elif modifier_token.name == 'throw':
                 modifiers |= FUNCTION_THROW
                 assert token.name == '(', token
                 # Consume everything between the (parens).
-                unused_tokens = list(self._GetMatchingChar('(', ')'))
+                exception_tokens = list(self._GetMatchingChar('(', ')'))
+                if len(exception_tokens) == 1:
+                    # throw() with an empty list.
+                    modifiers |= FUNCTION_NOEXCEPT
                 token = self._GetNextToken()
+            elif modifier_token.name == 'noexcept':
+                condition = ['true']
+                if token.name == '(':
+                    condition = [t.name for t in self._GetMatchingChar('(', ')')][:-1]
+                    token = self._GetNextToken()
+                if condition == ['true']:
+                    modifiers |= FUNCTION_NOEXCEPT
             elif modifier_token.name == modifier_token.name.upper():
                 # HACK(nnorwitz):  assume that all upper-case names
                 # are some macro we aren't expanding.
                 modifiers |= FUNCTION_UNKNOWN_ANNOTATION
+                if modifier_token.name in NOTHROW_ANNOTATIONS:
+                    modifiers |= FUNCTION_NOEXCEPT
             else:
                 self.HandleError('unexpected token', modifier_token)
 
@@ -1072,17 +1169,26 @@ class AstBuilder(object):
             return self._CreateVariable(indices, real_name.name, indices.name,
                                         modifiers, '', None)
 
-        if token.name == '{':
+        if token.name == '{' and self.declarations_only:
+            self._SkipScope()
+            body = []
+        elif token.name == '{':
             body = list(self.GetScope())
             del body[-1]                # Remove trailing '}'.
         else:
             body = None
             if token.name == '=':
                 token = self._GetNextToken()
-                assert token.token_type == tokenize.CONSTANT, token
-                assert token.name == '0', token
-                modifiers |= FUNCTION_PURE_VIRTUAL
-                token = self._GetNextToken()
+                if token.name == 'default' or token.name == 'delete':
+                    # Ignore explicitly defaulted and deleted special members
+                    # in C++11.
+                    token = self._GetNextToken()
+                else:
+                    # Handle pure-virtual declarations.
+                    assert token.token_type == tokenize.CONSTANT, token
+                    assert token.name == '0', token
+                    modifiers |= FUNCTION_PURE_VIRTUAL
+                    token = self._GetNextToken()
 
             if token.name == '[':
                 # TODO(nnorwitz): store tokens and improve parsing.
@@ -1092,6 +1198,9 @@ class AstBuilder(object):
 
             assert token.name == ';', (token, return_type_and_name, parameters)
 
+        if self.name_filter is not None and not self.name_filter(name.name):
+            return None
+
         # Looks like we got a method, not a function.
         if len(return_type) > 2 and return_type[-1].name == '::':
             return_type, in_class = \
@@ -1186,6 +1295,11 @@ class AstBuilder(object):
         if name_tokens:
             name = ''.join([t.name for t in name_tokens])
 
+        # Skip the underlying type of an enum.
+        if token.token_type == tokenize.SYNTAX and token.name == ':':
+            unused_tokens, token = self._GetVarTokensUpTo(tokenize.SYNTAX,
+                                                          '{', ';')
+
         # Handle forward declarations.
         if token.token_type == tokenize.SYNTAX and token.name == ';':
             return ctor(token.start, token.end, name, None,
@@ -1197,8 +1311,12 @@ class AstBuilder(object):
                         self.namespace_stack)
 
         # Must be the type declaration.
-        fields = list(self._GetMatchingChar('{', '}'))
-        del fields[-1]                  # Remove trailing '}'.
+        if self.declarations_only:
+            self._SkipScope()
+            fields = []
+        else:
+            fields = list(self._GetMatchingChar('{', '}'))
+            del fields[-1]              # Remove trailing '}'.
         if token.token_type == tokenize.SYNTAX and token.name == '{':
             next = self._GetNextToken()
             new_type = ctor(token.start, token.end, name, fields,
@@ -1225,6 +1343,13 @@ class AstBuilder(object):
             is_variable = (var_token.token_type == tokenize.NAME and
                            next_token.name == ';')
             variable = var_token
+            if is_syntax and self._handling_typedef:
+                # A typedef of a pointer to the struct, the rest of which is
+                # read by handle_typedef().
+                self._AddBackTokens([var_token, next_token])
+                return Struct(name_tokens[0].start, name_tokens[0].end,
+                              ''.join([t.name for t in name_tokens]), None,
+                              None, None, self.namespace_stack)
             if is_syntax and not is_variable:
                 variable = next_token
                 temp = self._GetNextToken()
@@ -1254,6 +1379,10 @@ class AstBuilder(object):
         return self._GetNestedType(Union)
 
     def handle_enum(self):
+        # Scoped enums are declared like any other enum.
+        token = self._GetNextToken()
+        if token.name not in ('class', 'struct'):
+            self._AddBackToken(token)
         return self._GetNestedType(Enum)
 
     def handle_auto(self):
@@ -1370,6 +1499,8 @@ class AstBuilder(object):
             if len(tokens) >= 2:
                 tokens.append(name)
                 name = tokens[1]
+        if self.name_filter is not None and not self.name_filter(name.name):
+            return None
         new_type = tokens
         if tokens and isinstance(tokens[0], tokenize.Token):
             new_type = self.converter.ToType(tokens)[0]
@@ -1424,9 +1555,9 @@ class AstBuilder(object):
             elif token.name == 'friend':
                 return self.handle_friend()
         self._AddBackToken(token)
-        tokens, last = self._GetVarTokensUpTo(tokenize.SYNTAX, '(', ';')
-        tokens.append(last)
-        self._AddBackTokens(tokens)
+        mark = self._MarkTokens()
+        unused_tokens, last = self._GetVarTokensUpTo(tokenize.SYNTAX, '(', ';')
+        self._ResetTokens(mark)
         if last.name == '(':
             return self.GetMethod(FUNCTION_NONE, templated_types)
         # Must be a variable definition.
@@ -1522,9 +1653,14 @@ class AstBuilder(object):
             assert token.token_type == tokenize.SYNTAX, token
             assert token.name == '{', token
 
-            ast = AstBuilder(self.GetScope(), self.filename, class_name,
-                             visibility, self.namespace_stack)
-            body = list(ast.Generate())
+            if self.declarations_only:
+                self._SkipScope()
+                body = []
+            else:
+                ast = AstBuilder(self.GetScope(), self.filename, class_name,
+                                 visibility, self.namespace_stack,
+                                 name_filter=self.name_filter)
+                body = list(ast.Generate())
 
             if not self._handling_typedef:
                 token = self._GetNextToken()
@@ -1560,7 +1696,6 @@ class AstBuilder(object):
         # Create an internal token that denotes when the namespace is complete.
         internal_token = tokenize.Token(_INTERNAL_TOKEN, _NAMESPACE_POP,
                                         None, None)
-        internal_token.whence = token.whence
         if token.name == '=':
             # TODO(nnorwitz): handle aliasing namespaces.
             name, next_token = self.GetName()
@@ -1650,17 +1785,24 @@ class AstBuilder(object):
         self._IgnoreUpTo(tokenize.SYNTAX, ';')
 
 
-def BuilderFromSource(source, filename):
+def BuilderFromSource(source, filename, tokenizer=tokenize.GetTokens,
+                      declarations_only=False, name_filter=None):
     """Utility method that returns an AstBuilder from source code.
 
     Args:
       source: 'C++ source code'
       filename: 'file1'
+      tokenizer: tokenize.GetTokens or tokenize.GetTokensRegex
+      declarations_only: skip function, class and enum bodies
+      name_filter: callable that returns whether to build the declaration
+        with the given name
 
     Returns:
       AstBuilder
     """
-    return AstBuilder(tokenize.GetTokens(source), filename)
+    return AstBuilder(tokenizer(source), filename,
+                      declarations_only=declarations_only,
+                      name_filter=name_filter)
 
 
 def PrintIndentifiers(filename, should_print):
@@ -0,0 +1,55 @@
+import os
+
+class IncludeResolver(object):
+    '''
+    Finds headers on an include path the way the compiler does: the first
+    include directory containing the header wins.
+
+    Each directory is listed at most once and kept as an index of its
+    entries, so resolving many headers against large SDK trees costs one
+    listdir per directory instead of one stat per header per directory.
+    '''
+
+    def __init__(self, includeDirs):
+        self.includeDirs = includeDirs
+        self._listings = {}
+
+    def resolve(self, fileName):
+        '''Returns the path to fileName, or None if no include dir has it'''
+        if os.path.isabs(fileName):
+            # No include dir is searched for an absolute path
+            return fileName if os.path.exists(fileName) else None
+
+        parts = fileName.replace('\\', '/').split('/')
+
+        for dir in self.includeDirs:
+            path = dir
+            for part in parts:
+                # Doubled separators leave empty parts, which name no entry
+                if not part:
+                    continue
+                if part in (os.curdir, os.pardir):
+                    path = os.path.join(path, part)
+                    continue
+
+                entry = self._listing(path).get(os.path.normcase(part))
+                if entry is None:
+                    break
+                path = os.path.join(path, entry)
+            else:
+                return path
+
+        return None
+
+    def _listing(self, dir):
+        '''Returns {normcase(name): name} for the entries of dir'''
+        listing = self._listings.get(dir)
+        if listing is None:
+            try:
+                names = os.listdir(dir or os.curdir)
+            except OSError:
+                names = []
+            listing = dict((os.path.normcase(name), name) for name in names)
+            self._listings[dir] = listing
+
+        return listing
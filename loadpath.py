@@ -1,5 +1,5 @@
 import os, sys
 
 fileDir = os.path.dirname(__file__)
-sys.path.append(os.path.join(fileDir, 'gmock-1.6.0\\scripts\\generator'))
+sys.path.append(os.path.join(fileDir, 'gmock-1.6.0', 'scripts', 'generator'))
 sys.path.append(os.path.join(fileDir, 'PyYAML-3.10'))
\ No newline at end of file
@@ -0,0 +1,191 @@
+import filecmp
+import hashlib
+import json
+import os
+import shutil
+
+MANIFEST_FILE = 'manifest.json'
+
+'''
+Bump whenever the generated wrappers change for the same inputs, so that
+outputs written by an older generator are not considered up to date
+'''
+MANIFEST_VERSION = 1
+
+'''
+Size in bytes of the write buffer of each OutputWriter.  The text layer
+already hands its writes over in chunks of several KiB, so a larger buffer
+saves no system calls and only adds to the memory held by the three
+writers open at once
+'''
+OUTPUT_BUFFER_SIZE = 1 << 10
+
+def hashFile(filePath):
+    with open(filePath, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+def writeIfChanged(filePath, content):
+    '''
+    Writes content to filePath unless the file already holds exactly that
+    content, so its mtime only changes when its contents do.  Returns
+    whether the file was written
+    '''
+    try:
+        with open(filePath, 'rt') as file:
+            if file.read() == content:
+                return False
+    except IOError:
+        pass
+
+    with open(filePath, 'wt') as file:
+        file.write(content)
+    return True
+
+class OutputWriter(object):
+    '''
+    Buffered writer of a generated file that, like writeIfChanged, leaves
+    the file untouched when it already holds exactly the text written.
+
+    The text is streamed to a temporary file next to filePath, so it is
+    never held in memory as a whole.  When the writer is closed the
+    temporary file replaces filePath if the two differ and is removed
+    otherwise; if the with block raises, filePath is left as it was
+    '''
+
+    def __init__(self, filePath):
+        self.path = filePath
+        self.size = 0
+        self.written = False
+        self._temp_file = '{0}.{1}.tmp'.format(filePath, os.getpid())
+        self._file = open(self._temp_file, 'wt', buffering=OUTPUT_BUFFER_SIZE)
+
+    def write(self, text):
+        self._file.write(text)
+
+    def writelines(self, texts):
+        self._file.writelines(texts)
+
+    def finish(self):
+        '''
+        Closes the temporary file once all of the text has been written, so
+        it is not held open until close moves it to filePath
+        '''
+        self._file.close()
+
+    def close(self):
+        '''Moves the text written to filePath unless it is unchanged.  Returns whether it was moved'''
+        self._file.close()
+        self.size = os.path.getsize(self._temp_file)
+        if os.path.exists(self.path):
+            if filecmp.cmp(self._temp_file, self.path, shallow=False):
+                os.remove(self._temp_file)
+                return False
+            shutil.copymode(self.path, self._temp_file)
+
+        os.replace(self._temp_file, self.path)
+        self.written = True
+        return True
+
+    def discard(self):
+        self._file.close()
+        os.remove(self._temp_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            self.discard()
+
+class Manifest(object):
+    '''
+    Record of the inputs and outputs of the last generation.
+
+    It holds hashes of the functions file, the options that shape the
+    output, every header that was parsed and every file that was written.
+    When none of them changed the wrappers are already up to date and
+    nothing needs to be parsed or written.  Headers are only hashed when
+    their size or mtime differs from the recorded one.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._load()
+
+    def isUpToDate(self, config, options, headerPaths):
+        '''
+        Returns True if the function file contents config, options and the
+        headers at headerPaths are the ones the recorded outputs were
+        generated from, and the outputs have not been changed since.
+
+        The inputs are fingerprinted before anything is parsed, and those
+        fingerprints are what record saves; inputs that change while the
+        wrappers are generated are seen as changed by the next run
+        '''
+        self._inputs = (
+            hashlib.sha1(config.encode('utf-8')).hexdigest(),
+            options,
+            dict((filePath, self._fingerprint(filePath, self.headers.get(filePath)))
+                 for filePath in headerPaths))
+
+        if self.version != MANIFEST_VERSION:
+            return False
+        if self._inputs != (self.config, self.options, self.headers):
+            return False
+
+        for filePath, digest in self.outputs.items():
+            try:
+                if hashFile(filePath) != digest:
+                    return False
+            except IOError:
+                return False
+
+        return True
+
+    def record(self, outputPaths):
+        '''Records outputPaths as generated from the inputs last passed to isUpToDate'''
+        self.version = MANIFEST_VERSION
+        self.config, self.options, self.headers = self._inputs
+        self.outputs = dict((filePath, hashFile(filePath)) for filePath in outputPaths)
+
+    def save(self):
+        temp_file = self.path + '.tmp'
+        with open(temp_file, 'wt') as file:
+            json.dump({
+                'version': self.version,
+                'config': self.config,
+                'options': self.options,
+                'headers': self.headers,
+                'outputs': self.outputs}, file, indent=1, sort_keys=True)
+        os.replace(temp_file, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, 'rt') as file:
+                manifest = json.load(file)
+        except (IOError, ValueError):
+            manifest = {}
+
+        self.version = manifest.get('version')
+        self.config = manifest.get('config')
+        self.options = manifest.get('options')
+        self.headers = manifest.get('headers', {})
+        self.outputs = manifest.get('outputs', {})
+
+    def _fingerprint(self, filePath, known):
+        '''
+        Returns [size, mtime, digest], only hashing headers that changed, or
+        None if the header cannot be read
+        '''
+        try:
+            stat = os.stat(filePath)
+        except OSError:
+            return None
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime:
+            return list(known)
+        try:
+            return [stat.st_size, stat.st_mtime, hashFile(filePath)]
+        except IOError:
+            return None
@@ -0,0 +1,228 @@
+import loadpath
+import getopt
+import io
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import cfunctionwrapper
+
+USAGE = 'Usage:\n\n' + __file__ + ''' [-o directory] [-c compile_command] [-n calls]
+        [--no-run]'''
+
+DESCRIPTION = '''
+Compare the cost of calling a C function directly, through the virtual
+wrappers, through a final component, through the policy wrappers and
+through a function pointer table
+
+Generates the virtual, final, policy and table wrappers of a small C
+function, and a C++ program calling it in a loop directly, through the
+virtual interface, through a final component, through the policy interface
+and through the table.  The program is then compiled and run, printing the
+nanoseconds taken by each call.  The virtual interface, the final component
+and the table are reached through pointers the compiler cannot see
+through, and the interface and the table have a second implementation
+standing in for the mock, as in code that is handed its wrapper
+
+directory               [Default: A temporary directory] Directory the wrappers,
+                        the program and its executable are written to
+compile_command         [Default: cl.exe /nologo /EHsc /O2 on Windows, else the
+                        CXX environment variable or c++, with -O2] Command
+                        compiling a C++ source file into an executable
+calls                   [Default: 100000000] Number of calls timed per variant
+
+--no-run = Only write the wrappers and the program
+'''
+
+DEFAULT_CALLS = 100000000
+
+if os.name == 'nt':
+    DEFAULT_COMPILE_COMMAND = 'cl.exe /nologo /EHsc /O2'
+else:
+    DEFAULT_COMPILE_COMMAND = os.environ.get('CXX', 'c++') + ' -O2'
+
+HEADER = '''#ifndef BENCH_H
+#define BENCH_H
+
+/* Declares that a function does not throw, as glibc's headers do */
+#ifndef __THROW
+#ifdef __cplusplus
+#define __THROW throw()
+#else
+#define __THROW
+#endif
+#endif
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+int bench_add(int total, int value) __THROW;
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
+'''
+
+FUNCTION_FILE = '''Functions:
+  - {name: bench_add, real_header: bench.h, include_header: bench.h}
+Aggregators:
+  - {name: Bench, functions: [bench_add]}
+'''
+
+'''
+The benchmark program
+
+{0} = Number of calls timed per variant
+'''
+PROGRAM_TEMPLATE = '''#include <chrono>
+#include <cstdio>
+#include <Virtual/Component/CWrappers.h>
+#include <Final/Component/CWrappers.h>
+#include <Policy/Component/CWrappers.h>
+#include <Table/Component/CWrappers.h>
+
+extern "C" int bench_add(int total, int value) __THROW
+{{
+    return total + value;
+}}
+
+static const int CALLS = {0};
+static volatile int sink;
+
+template <class Call>
+static void timeCalls(const char* name, Call call)
+{{
+    std::chrono::steady_clock::time_point start = std::chrono::steady_clock::now();
+    int total = 0;
+    for (int i = 0; i < CALLS; ++i)
+    {{
+        total = call(total, i);
+    }}
+    std::chrono::duration<double, std::nano> elapsed = std::chrono::steady_clock::now() - start;
+    sink = total;
+    std::printf("%-8s %8.3f ns/call\\n", name, elapsed.count() / CALLS);
+}}
+
+// Stands in for the mock of the unit tests.  With a single implementation of
+// the virtual interface the compiler may guess the target of every call
+class FakeBench : public Virtual::IBenchWrapper
+{{
+public:
+    int mybench_add(int total, int value) const
+    {{
+        return total - value;
+    }}
+}};
+
+static int fakeBenchAdd(int total, int value)
+{{
+    return total - value;
+}}
+
+// Code written against the policy interface takes the wrapper as a template
+// parameter
+template <class Wrapper>
+static int callPolicy(const Policy::IBenchWrapper<Wrapper>& wrapper, int total, int value)
+{{
+    return wrapper.mybench_add(total, value);
+}}
+
+int main()
+{{
+    Virtual::Component::BenchWrapper virtualComponent;
+    FakeBench fake;
+    Virtual::IBenchWrapper* volatile opaque = sink ? static_cast<Virtual::IBenchWrapper*>(&fake) : &virtualComponent;
+    const Virtual::IBenchWrapper& virtualWrapper = *opaque;
+    Final::Component::BenchWrapper finalComponent;
+    Final::Component::BenchWrapper* volatile opaqueFinal = &finalComponent;
+    const Final::Component::BenchWrapper& finalWrapper = *opaqueFinal;
+    Policy::Component::BenchWrapper policyWrapper;
+    Table::IBenchWrapper fakeTable = {{ &fakeBenchAdd }};
+    const Table::IBenchWrapper* volatile opaqueTable = sink ? &fakeTable : &Table::Component::BenchWrapper();
+    const Table::IBenchWrapper& table = *opaqueTable;
+
+    timeCalls("direct", [](int total, int value) {{ return bench_add(total, value); }});
+    timeCalls("virtual", [&](int total, int value) {{ return virtualWrapper.mybench_add(total, value); }});
+    timeCalls("final", [&](int total, int value) {{ return finalWrapper.mybench_add(total, value); }});
+    timeCalls("policy", [&](int total, int value) {{ return callPolicy(policyWrapper, total, value); }});
+    timeCalls("table", [&](int total, int value) {{ return table.mybench_add(total, value); }});
+    return 0;
+}}
+'''
+
+def writeSources(directory, calls=DEFAULT_CALLS):
+    '''
+    Writes the header, the virtual, final, policy and table wrappers and the
+    program into directory.  Returns the path of the program
+    '''
+    with open(os.path.join(directory, 'bench.h'), 'wt') as file:
+        file.write(HEADER)
+    function_file = os.path.join(directory, 'bench.yaml')
+    with open(function_file, 'wt') as file:
+        file.write(FUNCTION_FILE)
+
+    cwd = os.getcwd()
+    original_stdout = sys.stdout
+    os.chdir(directory)
+    sys.stdout = io.StringIO()
+    try:
+        for namespace, options in (('Virtual', {}), ('Final', {'final': True}), ('Policy', {'policy': True}), ('Table', {'table': True})):
+            cfunctionwrapper.generate(function_file, directory + cfunctionwrapper.PATH_SEPARATOR,
+                generateGmock=False, base_namespace=namespace, use_cache=False, force=True, **options)
+    finally:
+        sys.stdout = original_stdout
+        os.chdir(cwd)
+
+    program = os.path.join(directory, 'policybenchmark.cpp')
+    with open(program, 'wt') as file:
+        file.write(PROGRAM_TEMPLATE.format(calls))
+    return program
+
+def getCompileArguments(compile_command, directory, program, executable):
+    include_dirs = (directory, os.path.join(directory, cfunctionwrapper.BASE_INCLUDE))
+    arguments = shlex.split(compile_command, posix=os.name != 'nt')
+    if os.name == 'nt':
+        return arguments + ['/I' + path for path in include_dirs] + [program, '/Fe' + executable]
+    return arguments + ['-std=c++11'] + ['-I' + path for path in include_dirs] + [program, '-o', executable]
+
+def usage():
+    print(USAGE + '\n' + DESCRIPTION)
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'o:c:n:', ['output=', 'compile=', 'calls=', 'no-run'])
+        directory = None
+        compile_command = DEFAULT_COMPILE_COMMAND
+        calls = DEFAULT_CALLS
+        run = True
+        for o, a in opts:
+            if o in ('-o', '--output'):
+                directory = os.path.abspath(a)
+            elif o in ('-c', '--compile'):
+                compile_command = a
+            elif o in ('-n', '--calls'):
+                calls = int(a)
+            elif o == '--no-run':
+                run = False
+    except (getopt.GetoptError, ValueError) as err:
+        print(err)
+        usage()
+        sys.exit(2)
+
+    if directory is None:
+        directory = tempfile.mkdtemp()
+    elif not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    program = writeSources(directory, calls)
+    print('Wrote {0}'.format(program))
+    if not run:
+        sys.exit(0)
+
+    executable = os.path.join(directory, 'policybenchmark' + ('.exe' if os.name == 'nt' else ''))
+    subprocess.check_call(getCompileArguments(compile_command, directory, program, executable), cwd=directory)
+    subprocess.check_call([executable])
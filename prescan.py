@@ -0,0 +1,155 @@
+import bisect
+import re
+
+'''
+The handful of things the pre-scan has to recognise in raw header text.
+Anything else (identifiers, operators, numbers) is skipped by the regex
+engine without ever reaching Python code
+'''
+_SCAN_RE = re.compile(r'''
+      (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+    | (?P<string>"(?:\\.|[^"\\\n])*"?|'(?:\\.|[^'\\\n])*'?)
+    | (?P<preprocessor>^[ \t]*\#(?:\\\n|/\*.*?\*/|[^\n])*)
+    | (?P<brace>[{}])
+    | (?P<semicolon>;)
+    ''', re.VERBOSE | re.MULTILINE | re.DOTALL)
+
+_DIRECTIVE_RE = re.compile(r'[ \t]*#[ \t]*(\w*)(.*)', re.DOTALL)
+
+_IDENTIFIER_RE = re.compile(r'[A-Za-z_$][\w$]*$')
+
+_NOISE_RE = re.compile(r'//[^\n]*|/\*.*?\*/|^[ \t]*#[^\n]*', re.MULTILINE | re.DOTALL)
+
+'''
+Scopes whose contents the AST builder treats as top-level declarations
+'''
+_TRANSPARENT_SCOPE_RE = re.compile(r'\s*(extern\s*"C(?:\+\+)?"|(?:inline\s+)?namespace(?:\s+\w+)?)\s*$')
+
+def extractDeclarations(source, funcsToFind):
+    '''
+    Cuts the top-level declarations that mention any of funcsToFind out of
+    source, so only they have to go through the C++ tokenizer and AST
+    builder.
+
+    Returns (window, names) where window is the extracted source, wrapped in
+    any extern "C" or namespace blocks it was declared in, and names is the
+    subset of funcsToFind that occurs in code (outside comments, strings,
+    preprocessor lines and #if 0 blocks).  Names not in that set cannot be
+    found by parsing the whole header either.  Names that are not plain
+    identifiers, like operators, cannot be searched for and are always
+    included in names without being extracted.
+    '''
+    identifiers = [name for name in funcsToFind if _IDENTIFIER_RE.match(name)]
+    others = set(funcsToFind).difference(identifiers)
+    if not identifiers:
+        return '', others
+
+    name_re = re.compile(r'(?<![\w$])(?:%s)(?![\w$])' % '|'.join(map(re.escape, identifiers)))
+    hits = [(m.start(), m.group()) for m in name_re.finditer(source)]
+    if not hits:
+        return '', others
+
+    ignored, regions = _scan(source, hits[-1][0])
+
+    ignored_starts = [start for start, end in ignored]
+    code_hits = []
+    for position, name in hits:
+        index = bisect.bisect_right(ignored_starts, position) - 1
+        if index >= 0 and position < ignored[index][1]:
+            continue
+        code_hits.append((position, name))
+
+    window = []
+    emitted_scopes = ()
+    hit_index = 0
+    for start, end, scopes in regions:
+        while hit_index < len(code_hits) and code_hits[hit_index][0] < start:
+            hit_index += 1
+        if hit_index == len(code_hits):
+            break
+        if code_hits[hit_index][0] >= end:
+            continue
+
+        common = 0
+        while (common < len(scopes) and common < len(emitted_scopes) and
+               scopes[common] == emitted_scopes[common]):
+            common += 1
+        window.extend('}\n' for scope in emitted_scopes[common:])
+        window.extend(scope + ' {\n' for scope in scopes[common:])
+        emitted_scopes = scopes
+
+        window.append(source[start:end])
+        window.append('\n')
+
+    window.extend('}\n' for scope in emitted_scopes)
+    return ''.join(window), others.union(name for position, name in code_hits)
+
+def _scan(source, last_hit):
+    '''
+    Returns (ignored, regions).  ignored is the ordered list of (start, end)
+    spans the AST builder never looks at for declarations.  regions is the
+    list of (start, end, scopes) top-level declarations, split on semicolons
+    outside of any braces other than transparent scopes.
+
+    Scanning stops at the end of the region containing last_hit
+    '''
+    ignored = []
+    regions = []
+    scopes = []
+    depth = 0
+    region_start = 0
+    skip_start = None
+    skip_count = 0
+
+    for m in _SCAN_RE.finditer(source):
+        kind = m.lastgroup
+
+        if kind == 'preprocessor':
+            directive, condition = _DIRECTIVE_RE.match(m.group()).groups()
+            if skip_start is not None:
+                if directive.startswith('if'):
+                    skip_count += 1
+                elif directive == 'endif':
+                    skip_count -= 1
+                    if skip_count == 0:
+                        ignored.append((skip_start, m.end()))
+                        skip_start = None
+            elif (directive == 'if' and
+                  condition.strip().startswith(('0', '(0)'))):
+                skip_start = m.start()
+                skip_count = 1
+            else:
+                ignored.append((m.start(), m.end()))
+            continue
+
+        if skip_start is not None:
+            continue
+
+        if kind in ('comment', 'string'):
+            ignored.append((m.start(), m.end()))
+        elif kind == 'semicolon':
+            if depth == 0:
+                regions.append((region_start, m.end(), tuple(scopes)))
+                region_start = m.end()
+                if region_start > last_hit:
+                    return ignored, regions
+        elif m.group() == '{':
+            if depth == 0:
+                prefix = _NOISE_RE.sub('', source[region_start:m.start()])
+                opener = _TRANSPARENT_SCOPE_RE.match(prefix)
+                if opener:
+                    scopes.append(' '.join(opener.group(1).split()))
+                    region_start = m.end()
+                    continue
+            depth += 1
+        elif depth > 0:
+            depth -= 1
+        elif scopes:
+            scopes.pop()
+            region_start = m.end()
+
+    if skip_start is not None:
+        ignored.append((skip_start, len(source)))
+    regions.append((region_start, len(source), tuple(scopes)))
+
+    return ignored, regions
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import pickle
+import time
+
+DEFAULT_CACHE_DIR = '.cfwcache'
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+'''
+Bump whenever FunctionPrototype or the cpp.ast node layout changes so
+that stale pickles are discarded instead of loaded
+'''
+CACHE_VERSION = 6
+
+INDEX_FILE = 'index.json'
+
+class PrototypeCache(object):
+    '''
+    Persistent store of the FunctionPrototypes found in a header.
+
+    Entries are keyed by the SHA-1 of the header contents.  The index also
+    remembers the size and mtime each header path had when it was hashed, so
+    an untouched header is matched without being read at all.  Least recently
+    used entries are evicted once the cache grows past max_size bytes.
+    '''
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._fingerprints = {}
+        self._loadIndex()
+
+    def get(self, filePath):
+        '''Returns the cached prototypes for filePath, or None on a miss'''
+        digest = self._fingerprint(filePath)[2]
+        entry = self.entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        try:
+            with open(self._entryPath(digest), 'rb') as file:
+                prototypes = pickle.load(file)
+        except Exception:
+            self._removeEntry(digest)
+            self.misses += 1
+            return None
+
+        entry['last_used'] = time.time()
+        self._rememberHeader(filePath)
+        self.hits += 1
+        return prototypes
+
+    def put(self, filePath, prototypes):
+        digest = self._fingerprint(filePath)[2]
+        data = pickle.dumps(prototypes, pickle.HIGHEST_PROTOCOL)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self._entryPath(digest), 'wb') as file:
+            file.write(data)
+
+        self.entries[digest] = {'size': len(data), 'last_used': time.time()}
+        self._rememberHeader(filePath)
+        self._evict(digest)
+
+    def save(self):
+        if not self.entries and not os.path.isdir(self.cache_dir):
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        index_file = os.path.join(self.cache_dir, INDEX_FILE)
+        temp_file = index_file + '.tmp'
+        with open(temp_file, 'wt') as file:
+            json.dump({
+                'version': CACHE_VERSION,
+                'headers': self.headers,
+                'entries': self.entries}, file)
+        os.replace(temp_file, index_file)
+
+    def clear(self):
+        for digest in list(self.entries):
+            self._removeEntry(digest)
+        self.headers = {}
+        self._fingerprints = {}
+
+    def _loadIndex(self):
+        self.headers = {}
+        self.entries = {}
+
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE), 'rt') as file:
+                index = json.load(file)
+        except (IOError, ValueError):
+            return
+
+        if index.get('version') != CACHE_VERSION:
+            return
+
+        self.headers = index.get('headers', {})
+        self.entries = index.get('entries', {})
+
+    def _fingerprint(self, filePath):
+        '''Returns (size, mtime, digest), only hashing headers that changed'''
+        key = os.path.abspath(filePath)
+        stat = os.stat(filePath)
+
+        known = self._fingerprints.get(key) or self.headers.get(key)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime:
+            fingerprint = tuple(known)
+        else:
+            with open(filePath, 'rb') as file:
+                digest = hashlib.sha1(file.read()).hexdigest()
+            fingerprint = (stat.st_size, stat.st_mtime, digest)
+
+        self._fingerprints[key] = fingerprint
+        return fingerprint
+
+    def _rememberHeader(self, filePath):
+        key = os.path.abspath(filePath)
+        fingerprint = self._fingerprints[key]
+        previous = self.headers.get(key)
+        self.headers[key] = list(fingerprint)
+
+        # The old contents of this header are garbage unless another
+        # header path still shares them.
+        if previous and previous[2] != fingerprint[2]:
+            if not any(h[2] == previous[2] for h in self.headers.values()):
+                self._removeEntry(previous[2])
+
+    def _evict(self, keep):
+        total = sum(entry['size'] for entry in self.entries.values())
+
+        by_age = sorted(self.entries, key=lambda d: self.entries[d]['last_used'])
+        for digest in by_age:
+            if total <= self.max_size:
+                break
+            if digest == keep:
+                continue
+            total -= self.entries[digest]['size']
+            self._removeEntry(digest)
+
+    def _removeEntry(self, digest):
+        self.entries.pop(digest, None)
+        for key in [k for k, h in self.headers.items() if h[2] == digest]:
+            del self.headers[key]
+
+        try:
+            os.remove(self._entryPath(digest))
+        except OSError:
+            pass
+
+    def _entryPath(self, digest):
+        return os.path.join(self.cache_dir, digest + '.pickle')
+
+class MemoryCache(object):
+    '''
+    Prototypes of the headers seen so far, kept in memory for processes that
+    generate the wrappers over and over, like watch mode.
+
+    A header is only looked up again, in the optional backing PrototypeCache
+    or by parsing it, once its size or mtime differs from when it was read.
+    '''
+
+    def __init__(self, backing=None):
+        self.backing = backing
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._pending = {}
+
+    def get(self, filePath):
+        '''Returns the prototypes for filePath, or None if it must be parsed'''
+        key = os.path.abspath(filePath)
+        stat = os.stat(filePath)
+        fingerprint = (stat.st_size, stat.st_mtime)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == fingerprint:
+            self.hits += 1
+            return entry[1]
+
+        prototypes = None
+        if self.backing is not None:
+            prototypes = self.backing.get(filePath)
+
+        if prototypes is None:
+            self._pending[key] = fingerprint
+            self.misses += 1
+            return None
+
+        self._entries[key] = (fingerprint, prototypes)
+        self.hits += 1
+        return prototypes
+
+    def put(self, filePath, prototypes):
+        # Remember the header as it was before parsing, so that changes made
+        # while it was parsed are picked up by the next get.
+        key = os.path.abspath(filePath)
+        fingerprint = self._pending.pop(key, None)
+        if fingerprint is not None:
+            self._entries[key] = (fingerprint, prototypes)
+
+        if self.backing is not None:
+            self.backing.put(filePath, prototypes)
+
+    def save(self):
+        if self.backing is not None:
+            self.backing.save()
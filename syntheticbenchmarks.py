@@ -0,0 +1,297 @@
+import loadpath
+import getopt
+import io
+import json
+import os
+import pickle
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import cfunctionwrapper
+from cfwclasses import FunctionWrapper, FunctionAggregate
+from cpp import ast
+from cpp import tokenize
+
+USAGE = 'Usage:\n\n' + __file__ + ''' [-s sizes] [-p parameters] [-w every] [-r repeat]
+        [-m macros] [-c comments] [-d disabled] [-o results_file]'''
+
+DESCRIPTION = '''
+Time the wrapper generator on synthetic C headers of growing size
+
+For each size a header declaring that many functions is generated, along with
+a function file wrapping some of them.  Each function comes with macros,
+comments and #if 0 blocks.  The tokenizers, the AST builder,
+getFunctionASTs, the emission of the wrapper classes for the parsed
+prototypes and generate() are timed on it
+
+sizes                   [Default: 100,1000,5000] Comma separated numbers of
+                        functions per header
+parameters              [Default: 3] Number of parameters of each function
+every                   [Default: 10] Wrap every every-th function of the header
+repeat                  [Default: 5] Number of timed runs of each stage
+macros                  [Default: 1] Number of #defines before each function
+comments                [Default: 1] Number of comments before each function
+disabled                [Default: 1] Number of #if 0 blocks before each function
+results_file            [Default: None] Path of a JSON file to save every timing
+                        to, for comparing runs
+'''
+
+DEFAULT_SIZES = (100, 1000, 5000)
+WANTED_EVERY = 10
+DEFAULT_MACROS = 1
+DEFAULT_COMMENTS = 1
+DEFAULT_DISABLED = 1
+AGGREGATE_SIZE = 10
+
+RETURN_TYPES = ('int', 'void', 'syn_flags', 'const char *', 'struct syn_handle *')
+PARAMETER_TYPES = ('int', 'unsigned long', 'const char *', 'void *', 'double', 'struct syn_handle *', 'syn_flags', 'const syn_flags *')
+
+'''The stages timed for each size, in the order they are reported'''
+STAGES = ('tokenize', 'tokenize_regex', 'ast', 'getFunctionASTs', 'wrappers', 'generate')
+
+def makeHeader(functions, parameters=3, macros=DEFAULT_MACROS, comments=DEFAULT_COMMENTS, disabled=DEFAULT_DISABLED, seed=0):
+    '''
+    Returns (source, names) where source is a C header declaring functions
+    functions of parameters parameters each, and names lists them in order.
+    Each function is preceded by macros #defines, comments comments and
+    disabled #if 0 blocks redeclaring it.  The same arguments always give the
+    same header
+    '''
+    rand = random.Random(seed)
+    lines = [
+        '#ifndef SYNTHETIC_H',
+        '#define SYNTHETIC_H',
+        '',
+        '#ifdef __cplusplus',
+        'extern "C" {',
+        '#endif',
+        '',
+        'struct syn_handle;',
+        'typedef unsigned int syn_flags;',
+        '']
+    names = []
+
+    for i in range(functions):
+        name = 'syn_function_{0}'.format(i)
+        names.append(name)
+
+        for j in range(macros):
+            lines.append('#define SYN_VALUE_{0}_{1} ({2} << {3})'.format(i, j, rand.randint(0, 255), j))
+        for j in range(comments):
+            if j % 2:
+                lines.append('// {0} returns a value for call {1}'.format(name, j))
+            else:
+                lines.append('/*')
+                lines.append(' * {0}: synthetic declaration {1}'.format(name, j))
+                lines.append(' */')
+        for j in range(disabled):
+            lines.append('#if 0')
+            lines.append('int {0}(int disabled_{1});'.format(name, j))
+            lines.append('#endif')
+
+        arguments = ', '.join(
+            '{0} p{1}'.format(rand.choice(PARAMETER_TYPES), j)
+            for j in range(parameters))
+        lines.append('{0} {1}({2});'.format(rand.choice(RETURN_TYPES), name, arguments or 'void'))
+        lines.append('')
+
+    lines.extend([
+        '#ifdef __cplusplus',
+        '}',
+        '#endif',
+        '',
+        '#endif',
+        ''])
+    return '\n'.join(lines), names
+
+def makeConfig(header, names, every=WANTED_EVERY):
+    '''
+    Returns a function file wrapping every every-th function of names from
+    header, grouped into aggregates of AGGREGATE_SIZE functions
+    '''
+    wanted = names[::every]
+    lines = ['Functions:']
+    for name in wanted:
+        lines.append('  - {{name: {0}, real_header: {1}, include_header: {1}}}'.format(name, header))
+
+    lines.append('Aggregators:')
+    for i in range(0, len(wanted), AGGREGATE_SIZE):
+        lines.append('  - {{name: Group{0}, functions: [{1}]}}'.format(
+            i // AGGREGATE_SIZE, ', '.join(wanted[i:i + AGGREGATE_SIZE])))
+
+    return '\n'.join(lines) + '\n'
+
+def timeRuns(func, repeat):
+    '''Returns the wall time in seconds of each of repeat calls to func'''
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+def summarize(times):
+    return {'min': min(times), 'median': statistics.median(times), 'times': times}
+
+def quietly(func):
+    '''Returns a function calling func with its printed output discarded'''
+    def call():
+        original_stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            return func()
+        finally:
+            sys.stdout = original_stdout
+    return call
+
+def emitWrappers(prototypes, aggregators):
+    '''
+    Returns the interface, component and mock classes generate() would emit
+    for prototypes and the Aggregators entries of a function file, as one
+    string
+    '''
+    wrappers = [FunctionWrapper(prototype) for prototype in prototypes]
+    classes = [wrapper.interface_class() + wrapper.component_class() for wrapper in wrappers]
+
+    resolved = cfunctionwrapper.resolveAggregates(aggregators, wrappers)
+    for name, aggregate_wrappers, missing in resolved + [('MasterC', wrappers, [])]:
+        aggregate = FunctionAggregate(name)
+        aggregate.wrappers = aggregate_wrappers
+        classes.append(aggregate.interface_aggregate())
+        classes.append(aggregate.component_aggregate())
+        classes.append(aggregate.mock_aggregate())
+
+    return ''.join(classes)
+
+def prepareSize(directory, functions, parameters, every=WANTED_EVERY, macros=DEFAULT_MACROS, comments=DEFAULT_COMMENTS, disabled=DEFAULT_DISABLED):
+    '''
+    Writes the header and function file for functions functions into
+    directory.  Returns (header path, function file path, header source)
+    '''
+    header = 'synthetic_{0}.h'.format(functions)
+    source, names = makeHeader(functions, parameters, macros, comments, disabled)
+    header_path = os.path.join(directory, header)
+    with open(header_path, 'wt') as file:
+        file.write(source)
+
+    function_file = os.path.join(directory, 'synthetic_{0}.yaml'.format(functions))
+    with open(function_file, 'wt') as file:
+        file.write(makeConfig(header, names, every))
+
+    return header_path, function_file, source
+
+def getStages(directory, header_path, function_file, source):
+    '''Returns {stage name: function running it} for the files of prepareSize'''
+    include_path = directory + cfunctionwrapper.PATH_SEPARATOR
+    with open(function_file, 'rt') as file:
+        configuration = cfunctionwrapper.yaml.safe_load(file.read())
+    tokens = list(tokenize.GetTokensRegex(source))
+    names = [item['name'] for item in configuration['Functions']]
+    # Each run starts from unpickled prototypes, as if read from the
+    # prototype cache, so nothing resolved by a previous run is reused
+    prototypes = pickle.dumps(cfunctionwrapper.parseHeader(header_path, names))
+
+    def generate():
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            cfunctionwrapper.generate(function_file, include_path, use_cache=False, force=True)
+        finally:
+            os.chdir(cwd)
+
+    return {
+        'tokenize': lambda: list(tokenize.GetTokens(source)),
+        'tokenize_regex': lambda: list(tokenize.GetTokensRegex(source)),
+        'ast': lambda: list(ast.AstBuilder(iter(tokens), header_path).Generate()),
+        'getFunctionASTs': quietly(lambda: cfunctionwrapper.getFunctionASTs(include_path, configuration['Functions'])),
+        'wrappers': lambda: emitWrappers(pickle.loads(prototypes), configuration['Aggregators']),
+        'generate': quietly(generate),
+        }
+
+def benchmarkSize(directory, functions, parameters, repeat, every=WANTED_EVERY, macros=DEFAULT_MACROS, comments=DEFAULT_COMMENTS, disabled=DEFAULT_DISABLED):
+    header_path, function_file, source = prepareSize(directory, functions, parameters, every, macros, comments, disabled)
+    stages = getStages(directory, header_path, function_file, source)
+
+    return {
+        'functions': functions,
+        'wanted': len(range(0, functions, every)),
+        'bytes': len(source),
+        'tokens': len(stages['tokenize_regex']()),
+        'stages': dict((name, summarize(timeRuns(stages[name], repeat))) for name in STAGES),
+        }
+
+def runSuite(sizes=DEFAULT_SIZES, parameters=3, repeat=5, every=WANTED_EVERY, macros=DEFAULT_MACROS, comments=DEFAULT_COMMENTS, disabled=DEFAULT_DISABLED):
+    '''Returns the results of benchmarking each of sizes, as saved to the results file'''
+    directory = tempfile.mkdtemp()
+    try:
+        results = [benchmarkSize(directory, functions, parameters, repeat, every, macros, comments, disabled) for functions in sizes]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': parameters,
+        'every': every,
+        'macros': macros,
+        'comments': comments,
+        'disabled': disabled,
+        'repeat': repeat,
+        'sizes': results,
+        }
+
+def printResults(suite):
+    print('{0:>10} {1:>10} {2:>10} {3:>12} {4:>12} {5:>12} {6:>16} {7:>12} {8:>12}'.format(
+        'functions', 'bytes', 'tokens', 'tokenize', 'regex', 'ast', 'getFunctionASTs', 'wrappers', 'generate'))
+    for result in suite['sizes']:
+        medians = [result['stages'][name]['median'] for name in STAGES]
+        print('{0:>10} {1:>10} {2:>10} {3:>12.4f} {4:>12.4f} {5:>12.4f} {6:>16.4f} {7:>12.4f} {8:>12.4f}'.format(
+            result['functions'], result['bytes'], result['tokens'], *medians))
+    print('Median seconds of {0} runs'.format(suite['repeat']))
+
+def usage():
+    print(USAGE + '\n' + DESCRIPTION)
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 's:p:w:r:m:c:d:o:', ['sizes=', 'parameters=', 'every=', 'repeat=', 'macros=', 'comments=', 'disabled=', 'results='])
+        sizes = DEFAULT_SIZES
+        parameters = 3
+        every = WANTED_EVERY
+        repeat = 5
+        macros = DEFAULT_MACROS
+        comments = DEFAULT_COMMENTS
+        disabled = DEFAULT_DISABLED
+        results_file = None
+        for o, a in opts:
+            if o in ('-s', '--sizes'):
+                sizes = [int(size) for size in a.split(',')]
+            elif o in ('-p', '--parameters'):
+                parameters = int(a)
+            elif o in ('-w', '--every'):
+                every = int(a)
+            elif o in ('-r', '--repeat'):
+                repeat = int(a)
+            elif o in ('-m', '--macros'):
+                macros = int(a)
+            elif o in ('-c', '--comments'):
+                comments = int(a)
+            elif o in ('-d', '--disabled'):
+                disabled = int(a)
+            elif o in ('-o', '--results'):
+                results_file = a
+    except (getopt.GetoptError, ValueError) as err:
+        print(err)
+        usage()
+        sys.exit(2)
+
+    suite = runSuite(sizes, parameters, repeat, every, macros, comments, disabled)
+    printResults(suite)
+
+    if results_file is not None:
+        with open(results_file, 'wt') as file:
+            json.dump(suite, file, indent=1)
@@ -1,7 +1,23 @@
+import io
+import json
 import os
+import pickle
 import shutil
 import subprocess
+import sys
+import tempfile
 import unittest
+from unittest import mock
+
+import cfunctionwrapper
+from cfwserver import GenerationServer
+import texttemplates
+from cfwclasses import FunctionPrototype, FunctionWrapper, FunctionAggregate
+from cpp import ast
+from cpp import tokenize
+from includeresolver import IncludeResolver
+from prescan import extractDeclarations
+from prototypecache import PrototypeCache, MemoryCache
 
 '''This test suite assumes Visual Studio for now'''
 CPP_COMPILER = 'cl.exe /nologo /EHsc /c'
@@ -100,5 +116,744 @@ class TestGenerationCompilation(unittest.TestCase):
         subprocess.check_call(UNIT_TEST_EXE)
         print('Done!')
 
+SAMPLE_HEADER = '''
+typedef int BOOL;
+typedef void *HANDLE;
+
+WINBASEAPI BOOL WINAPI CloseHandle(__in HANDLE hObject);
+
+struct Unrelated { int a; };
+
+WINBASEAPI HANDLE WINAPI GetCurrentProcess(void);
+'''
+
+SAMPLE_FUNCTIONS = [
+    {'name': 'CloseHandle', 'real_header': 'sample.h', 'include_header': 'sample.h'},
+    {'name': 'GetCurrentProcess', 'real_header': 'sample.h', 'include_header': 'sample.h'},
+    ]
+
+class SampleHeaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.header = os.path.join(self.tempdir, 'sample.h')
+        self.cache_dir = os.path.join(self.tempdir, 'cache')
+        self.include_path = self.tempdir + PATH_SEPARATOR
+        with open(self.header, 'wt') as file:
+            file.write(SAMPLE_HEADER)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def getNames(self, cache, functions=SAMPLE_FUNCTIONS):
+        prototypes, found = cfunctionwrapper.getFunctionASTs(self.include_path, functions, cache)
+        return [p.function_name() for p in prototypes]
+
+class TestGetFunctionASTs(SampleHeaderTestCase):
+
+    def test_ParsingStopsOnceAllFunctionsAreFound(self):
+        with open(self.header, 'at') as file:
+            file.write('int broken(@);\n')
+        
+        output = io.StringIO()
+        sys.stdout = output
+        try:
+            names = self.getNames(None)
+        finally:
+            sys.stdout = sys.__stdout__
+        
+        self.assertEqual(['CloseHandle', 'GetCurrentProcess'], names)
+        self.assertEqual('', output.getvalue())
+
+    def test_MissingFunctionsAreReported(self):
+        functions = SAMPLE_FUNCTIONS + [
+            {'name': 'WriteFile', 'real_header': 'sample.h', 'include_header': 'sample.h'}]
+        
+        output = io.StringIO()
+        sys.stdout = output
+        try:
+            names = self.getNames(None, functions)
+        finally:
+            sys.stdout = sys.__stdout__
+        
+        self.assertEqual(['CloseHandle', 'GetCurrentProcess'], names)
+        self.assertEqual('Could not find WriteFile in sample.h\n', output.getvalue())
+
+    def test_ParallelParsingMatchesSerialOrder(self):
+        other = os.path.join(self.tempdir, 'other.h')
+        with open(other, 'wt') as file:
+            file.write('int other(int a);\n')
+        functions = [
+            {'name': 'other', 'real_header': 'other.h', 'include_header': 'other.h'}] + SAMPLE_FUNCTIONS
+        
+        serial = self.getNames(None, functions)
+        prototypes, found = cfunctionwrapper.getFunctionASTs(self.include_path, functions, None, 2)
+        
+        self.assertEqual(['other', 'CloseHandle', 'GetCurrentProcess'], serial)
+        self.assertEqual(serial, [p.function_name() for p in prototypes])
+
+    def test_ParallelWorkerErrorsAreReportedPerHeader(self):
+        os.mkdir(os.path.join(self.tempdir, 'broken.h'))
+        functions = [
+            {'name': 'broken', 'real_header': 'broken.h', 'include_header': 'broken.h'}] + SAMPLE_FUNCTIONS
+        
+        output = io.StringIO()
+        sys.stdout = output
+        try:
+            prototypes, found = cfunctionwrapper.getFunctionASTs(self.include_path, functions, None, 2)
+        finally:
+            sys.stdout = sys.__stdout__
+        
+        self.assertEqual(['CloseHandle', 'GetCurrentProcess'], [p.function_name() for p in prototypes])
+        self.assertTrue(output.getvalue().startswith('Failed to parse ' + os.path.join(self.tempdir, 'broken.h')))
+
+class TestIncludeResolver(SampleHeaderTestCase):
+
+    def test_FirstIncludeDirectoryWins(self):
+        second = os.path.join(self.tempdir, 'second')
+        os.makedirs(os.path.join(second, 'sub'))
+        for name in ('sample.h', os.path.join('sub', 'nested.h')):
+            with open(os.path.join(second, name), 'wt') as file:
+                file.write(SAMPLE_HEADER)
+        
+        resolver = IncludeResolver([self.tempdir, second])
+        
+        self.assertEqual(self.header, resolver.resolve('sample.h'))
+        self.assertEqual(os.path.join(second, 'sub', 'nested.h'), resolver.resolve('sub/nested.h'))
+        self.assertEqual(None, resolver.resolve('missing.h'))
+        
+        include_path = PATH_SEPARATOR.join((self.tempdir, second, ''))
+        prototypes, found = cfunctionwrapper.getFunctionASTs(include_path, SAMPLE_FUNCTIONS)
+        self.assertEqual(2, len(prototypes))
+        self.assertEqual(['sample.h'], found)
+
+    def test_AbsolutePathsAndDoubledSeparators(self):
+        os.makedirs(os.path.join(self.tempdir, 'sub'))
+        nested = os.path.join(self.tempdir, 'sub', 'nested.h')
+        with open(nested, 'wt') as file:
+            file.write(SAMPLE_HEADER)
+        
+        resolver = IncludeResolver([os.path.join(self.tempdir, 'sub')])
+        
+        self.assertEqual(self.header, resolver.resolve(self.header))
+        self.assertEqual(None, resolver.resolve(os.path.join(self.tempdir, 'missing.h')))
+        self.assertEqual(nested, IncludeResolver([self.tempdir]).resolve('sub//nested.h'))
+
+class TestPrescan(SampleHeaderTestCase):
+
+    def test_OnlyDeclarationsOfRequestedFunctionsAreExtracted(self):
+        source = '''
+#ifdef __cplusplus
+extern "C" {
+#endif
+/* CloseHandle is documented here */
+#if 0
+BOOL CloseHandle(int unused);
+#endif
+typedef struct _S { int CloseHandle; } S;
+WINBASEAPI BOOL WINAPI CloseHandle(__in HANDLE hObject);
+namespace Inner { int Missing(int a); }
+#define OpenHandle OpenHandleA
+#ifdef __cplusplus
+}
+#endif
+'''
+        window, present = extractDeclarations(source, ['CloseHandle', 'Missing', 'OpenHandle'])
+        
+        self.assertEqual(set(['CloseHandle', 'Missing']), present)
+        self.assertEqual('''extern "C" {
+
+#endif
+/* CloseHandle is documented here */
+#if 0
+BOOL CloseHandle(int unused);
+#endif
+typedef struct _S { int CloseHandle; } S;
+
+WINBASEAPI BOOL WINAPI CloseHandle(__in HANDLE hObject);
+namespace Inner {
+ int Missing(int a);
+}
+}
+''', window)
+
+    def test_PrescanMatchesFullParse(self):
+        names = ['GetCurrentProcess', 'CloseHandle']
+        
+        full = cfunctionwrapper.parseHeader(self.header, names, prescan=False)
+        windowed = cfunctionwrapper.parseHeader(self.header, names)
+        
+        self.assertEqual(
+            [FunctionWrapper(p).interface_class() for p in full],
+            [FunctionWrapper(p).interface_class() for p in windowed])
+
+class TestSignature(SampleHeaderTestCase):
+
+    def test_SignatureIsResolvedOnce(self):
+        prototype, = cfunctionwrapper.parseHeader(self.header, ['CloseHandle'])
+        signature = prototype.signature()
+        
+        self.assertIs(signature, prototype.signature())
+        self.assertEqual(
+            ('CloseHandle', 'BOOL', ('HANDLE',), ('hObject',), 1),
+            (signature.function_name, signature.return_type, signature.arg_types, signature.arg_names, signature.arity))
+        self.assertEqual(str(prototype.args()[0]), signature.args)
+        self.assertRaises(AttributeError, setattr, signature, 'arity', 2)
+        
+        copy = pickle.loads(pickle.dumps(signature))
+        self.assertEqual((signature.args, signature.arg_names_list), (copy.args, copy.arg_names_list))
+
+    def test_CallingConventionIsKept(self):
+        source = '''
+WINBASEAPI BOOL WINAPI a(int x);
+int __stdcall b(int x);
+int c(int x);
+'''
+        nodes = list(ast.BuilderFromSource(source, 'sample.h').Generate())
+        signatures = [cfunctionwrapper.FunctionPrototype(node).signature() for node in nodes]
+        
+        self.assertEqual(['WINAPI', '__stdcall', ''], [signature.calling_convention for signature in signatures])
+        self.assertEqual('BOOL', signatures[0].return_type)
+        self.assertEqual('WINAPI', pickle.loads(pickle.dumps(signatures[0])).calling_convention)
+
+    def test_NoThrowDeclarations(self):
+        source = '''
+int a(int x) __THROW;
+int b(int x) throw();
+int c(int x) throw(int);
+int d(int x) noexcept;
+int e(int x) noexcept(false);
+int f(int x) __attribute__ ((__nothrow__, __leaf__));
+int g(int x);
+'''
+        nodes = ast.AstBuilder(tokenize.GetTokens(source), 'nothrow.h').Generate()
+        
+        self.assertEqual(
+            ['a', 'b', 'd', 'f'],
+            [node.name for node in nodes if FunctionPrototype(node).signature().noexcept])
+
+TOKENIZER_SOURCE = SAMPLE_HEADER + r'''
+#include "dir//foo.h" // trailing comment
+#define LONG_MACRO(a, b) \
+    ((a) << 2 | (b) >> 1) /* comment */
+#if 0
+@ ignored `
+#endif
+namespace N { template <typename T> class C : public ::Base<T> { T *p; }; }
+const wchar_t *s = L"wide \"quoted\"\\";
+char c = '\''; char16_t u = u'x'; auto r = u8"utf8" R"raw";
+int x = a->b + .5e-3f - 0x1FuL * 017 / 2; x += y && !z || ~w; x <<= ++i;
+'''
+
+class TestTokenizer(unittest.TestCase):
+
+    def getTokens(self, tokenizer, source):
+        return [(t.token_type, t.name, t.start, t.end) for t in tokenizer(source)]
+
+    def test_RegexTokenizerMatchesCharacterScanner(self):
+        expected = self.getTokens(tokenize.GetTokens, TOKENIZER_SOURCE)
+        
+        self.assertEqual(expected, self.getTokens(tokenize.GetTokensRegex, TOKENIZER_SOURCE))
+        self.assertTrue(len(expected) > 100)
+
+    def test_RegexTokenizerMatchesCharacterScannerOnEdgeCases(self):
+        for source in ('#define A "a//b" \\\n  + 1\n', 'x = 1.5\n', "L'a' u8\"b\"\n", 'a /\n', '#if 0\n@ `\n#endif\n',
+                '/*/ a */ b\n', 'int a; /*/ int b; */ int c;\n', 'x /*/*/ y\n'):
+            self.assertEqual(
+                self.getTokens(tokenize.GetTokens, source),
+                self.getTokens(tokenize.GetTokensRegex, source))
+
+class TestAstBuilder(unittest.TestCase):
+
+    def test_TokenizerErrorIsRaisedAfterEarlierDeclarations(self):
+        names = []
+        stderr = sys.stderr
+        sys.stderr = io.StringIO()
+        try:
+            with self.assertRaises(RuntimeError):
+                for node in ast.BuilderFromSource('int first(int a);\nint second(int b);\n@\n', 'sample.h').Generate():
+                    names.append(node.name)
+        finally:
+            sys.stderr = stderr
+        
+        self.assertEqual(['first', 'second'], names)
+
+    def test_TokensPutBackAreReadAgainInSourceOrder(self):
+        source = '''
+static const struct { const char *name; } names[] = { 0 };
+namespace N { template <typename T> T inner(T a); }
+int after(int b);
+'''
+        nodes = list(ast.BuilderFromSource(source, 'sample.h').Generate())
+        
+        self.assertEqual('names', nodes[0].name)
+        self.assertEqual(ast.Struct, type(nodes[0].type.name))
+        self.assertEqual(['inner', 'after'], [n.name for n in nodes[1:]])
+        self.assertEqual(['N'], nodes[1].namespace)
+
+    def test_DeclarationsOnlySkipsBodies(self):
+        source = '''
+class Widget { public: int size() const { return { 1 }.x; } };
+enum Color { RED = '{', GREEN };
+static inline int twice(int a) { if (a) { return a * 2; } return 0; }
+int after(int b);
+'''
+        full = list(ast.BuilderFromSource(source, 'sample.h').Generate())
+        declarations = list(ast.BuilderFromSource(source, 'sample.h', declarations_only=True).Generate())
+        
+        self.assertEqual([type(n) for n in full], [type(n) for n in declarations])
+        self.assertEqual(['Widget', 'Color', 'twice', 'after'], [n.name for n in declarations])
+        self.assertTrue(full[0].body and full[2].body)
+        self.assertEqual([], declarations[0].body)
+        self.assertEqual([], declarations[1].fields)
+        self.assertEqual([], declarations[2].body)
+        self.assertEqual(str(full[2].parameters), str(declarations[2].parameters))
+        self.assertTrue(declarations[3].IsDeclaration())
+
+    def test_NameFilterSkipsOtherDeclarations(self):
+        source = '''
+#define WANTED_MACRO 1
+typedef int (*callback)(int);
+int unwanted(int a);
+int variable = 0;
+struct Point { int x; };
+long wanted(const char *p, callback cb);
+'''
+        nodes = list(ast.BuilderFromSource(source, 'sample.h', declarations_only=True,
+                                           name_filter=set(['wanted']).__contains__).Generate())
+        
+        self.assertEqual(['wanted'], [n.name for n in nodes if not isinstance(n, ast.Class)])
+        self.assertEqual(ast.Function, type(nodes[-1]))
+        self.assertEqual(['p', 'cb'], [p.name for p in nodes[-1].parameters])
+
+    def test_ScopedEnumsDoNotHideLaterDeclarations(self):
+        source = '''
+namespace absl {
+enum class LogSeverity : int { kInfo = 0, kWarning = 1 };
+enum struct Forward : unsigned long long;
+const char *LogSeverityName(LogSeverity s);
+}
+'''
+        for declarations_only in (False, True):
+            nodes = list(ast.BuilderFromSource(source, 'sample.h', declarations_only=declarations_only).Generate())
+            
+            self.assertEqual([ast.Enum, ast.Enum, ast.Function], [type(n) for n in nodes])
+            self.assertEqual(['LogSeverity', 'Forward', 'LogSeverityName'], [n.name for n in nodes])
+            self.assertEqual(['absl'], nodes[2].namespace)
+
+    def test_TypedefsOfStructPointersDoNotHideTheNextDeclaration(self):
+        source = 'typedef struct magic_set *magic_t;\nmagic_t magic_open(int flags);\nvoid magic_close(magic_t cookie);\n'
+        for declarations_only in (False, True):
+            nodes = list(ast.BuilderFromSource(source, 'magic.h', declarations_only=declarations_only).Generate())
+            
+            self.assertEqual(['magic_t', 'magic_open', 'magic_close'], [n.name for n in nodes])
+            self.assertEqual(ast.Typedef, type(nodes[0]))
+        for prescan in (False, True):
+            prototypes = cfunctionwrapper.parseHeaderSource(source, 'magic.h', ['magic_open', 'magic_close'], prescan)
+            
+            self.assertEqual(['magic_open', 'magic_close'], [p.function_name() for p in prototypes])
+
+    def test_BraceInitializedVariablesDoNotHideLaterDeclarations(self):
+        source = 'static Packet2d p2d_MZERO = { bit_cast<double>(0x8000000000000000ull), 0 };\nint after(int b);\n'
+        nodes = list(ast.BuilderFromSource(source, 'sample.h').Generate())
+        
+        self.assertEqual([ast.VariableDeclaration, ast.Function], [type(n) for n in nodes])
+        self.assertEqual(['p2d_MZERO', 'after'], [n.name for n in nodes])
+
+    def test_DeletedAndDefaultedMembersAreNotPureVirtual(self):
+        source = 'class Info { Info(const Info &) = delete; Info(Info &&) = default; virtual void f() = 0; };\nint after(int b);\n'
+        nodes = list(ast.BuilderFromSource(source, 'sample.h').Generate())
+        
+        self.assertEqual(['Info', 'after'], [n.name for n in nodes])
+        self.assertEqual([False, False, True], [bool(m.modifiers & ast.FUNCTION_PURE_VIRTUAL) for m in nodes[0].body])
+
+class TestPrototypeCache(SampleHeaderTestCase):
+
+    def test_SecondRunIsServedFromCache(self):
+        first = self.getNames(PrototypeCache(self.cache_dir))
+        
+        cache = PrototypeCache(self.cache_dir)
+        second = self.getNames(cache, SAMPLE_FUNCTIONS[1:])
+        
+        self.assertEqual(['CloseHandle', 'GetCurrentProcess'], first)
+        self.assertEqual(['GetCurrentProcess'], second)
+        self.assertEqual((1, 0), (cache.hits, cache.misses))
+
+    def test_ChangedHeaderIsReparsed(self):
+        self.getNames(PrototypeCache(self.cache_dir))
+        with open(self.header, 'at') as file:
+            file.write('BOOL WINAPI Added(HANDLE hObject);\n')
+        functions = SAMPLE_FUNCTIONS + [
+            {'name': 'Added', 'real_header': 'sample.h', 'include_header': 'sample.h'}]
+        
+        cache = PrototypeCache(self.cache_dir)
+        names = self.getNames(cache, functions)
+        
+        self.assertEqual(['CloseHandle', 'GetCurrentProcess', 'Added'], names)
+        self.assertEqual((0, 1), (cache.hits, cache.misses))
+        self.assertEqual(1, len(cache.entries))
+
+    def test_CacheDoesNotChangeFoundFunctions(self):
+        with open(self.header, 'wt') as file:
+            file.write('int broken(@);\n' + SAMPLE_HEADER)
+
+        sys.stdout = io.StringIO()
+        try:
+            uncached = self.getNames(None)
+            cached = self.getNames(PrototypeCache(self.cache_dir))
+            prototypes, found = cfunctionwrapper.getFunctionASTs(self.include_path, SAMPLE_FUNCTIONS, PrototypeCache(self.cache_dir), 2)
+            cache = PrototypeCache(self.cache_dir)
+            again = self.getNames(cache)
+        finally:
+            sys.stdout = sys.__stdout__
+
+        self.assertEqual(['CloseHandle', 'GetCurrentProcess'], uncached)
+        self.assertEqual(uncached, cached)
+        self.assertEqual(uncached, [p.function_name() for p in prototypes])
+        self.assertEqual(uncached, again)
+        self.assertEqual(0, len(cache.entries))
+
+    def test_LeastRecentlyUsedEntriesAreEvicted(self):
+        cache = PrototypeCache(self.cache_dir, max_size=1)
+        other = os.path.join(self.tempdir, 'other.h')
+        with open(other, 'wt') as file:
+            file.write('int other(int a);\n')
+        
+        cache.put(self.header, cfunctionwrapper.parseHeader(self.header))
+        cache.put(other, cfunctionwrapper.parseHeader(other))
+        
+        self.assertEqual(None, cache.get(self.header))
+        self.assertEqual(['other'], [p.function_name() for p in cache.get(other)])
+
+class TestMemoryCache(SampleHeaderTestCase):
+
+    def test_OnlyChangedHeadersAreReparsed(self):
+        cache = MemoryCache()
+        self.getNames(cache)
+        second = self.getNames(cache, SAMPLE_FUNCTIONS[1:])
+        
+        with open(self.header, 'at') as file:
+            file.write('BOOL WINAPI Added(HANDLE hObject);\n')
+        functions = SAMPLE_FUNCTIONS + [
+            {'name': 'Added', 'real_header': 'sample.h', 'include_header': 'sample.h'}]
+        third = self.getNames(cache, functions)
+        
+        self.assertEqual(['GetCurrentProcess'], second)
+        self.assertEqual(['CloseHandle', 'GetCurrentProcess', 'Added'], third)
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+
+class GenerationTestCase(SampleHeaderTestCase):
+
+    def setUp(self):
+        SampleHeaderTestCase.setUp(self)
+        self.function_file = os.path.join(self.tempdir, 'functions.yaml')
+        with open(self.function_file, 'wt') as file:
+            file.write('Functions:\n')
+            for function in SAMPLE_FUNCTIONS:
+                file.write('  - {{name: {name}, real_header: {real_header}, include_header: {include_header}}}\n'.format(**function))
+            file.write('Aggregators:\n  - {name: Handles, functions: [CloseHandle]}\n')
+        
+        self.cwd = os.getcwd()
+        os.chdir(self.tempdir)
+        self.outputs = (
+            os.path.join('CWrappers', 'Test', 'ICWrappers.h'),
+            os.path.join('CWrappers', 'Test', 'Component', 'CWrappers.h'),
+            os.path.join('CWrappers', 'Test', 'Mock', 'CWrappers.h'))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        SampleHeaderTestCase.tearDown(self)
+
+    def generate(self, base_namespace='Test', **kwargs):
+        output = io.StringIO()
+        sys.stdout = output
+        try:
+            cfunctionwrapper.generate(self.function_file, self.include_path, base_namespace=base_namespace, use_cache=False, **kwargs)
+        finally:
+            sys.stdout = sys.__stdout__
+        return output.getvalue()
+
+    def resetModified(self):
+        for path in self.outputs:
+            os.utime(path, (0, 0))
+
+    def getModified(self):
+        return [path for path in self.outputs if os.path.getmtime(path) != 0]
+
+class TestManifest(GenerationTestCase):
+
+    def test_UnchangedRunWritesNothing(self):
+        self.generate()
+        self.resetModified()
+        output = self.generate()
+        
+        self.assertEqual('Wrappers are up to date\n', output)
+        self.assertEqual([], self.getModified())
+        self.assertIn('Parsing files', self.generate(force=True))
+
+    def test_ForcedRunRecordsManifest(self):
+        self.generate()
+        output = self.generate(force=True)
+        
+        self.assertIn('Parsing files', output)
+        self.assertEqual('Wrappers are up to date\n', self.generate())
+
+    def test_BaseNamespacesKeepTheirOwnManifest(self):
+        self.generate()
+        self.generate(base_namespace='Other')
+        
+        self.assertEqual('Wrappers are up to date\n', self.generate())
+        self.assertEqual('Wrappers are up to date\n', self.generate(base_namespace='Other'))
+        self.assertTrue(os.path.isfile(os.path.join('CWrappers', 'Test', 'manifest.json')))
+        self.assertTrue(os.path.isfile(os.path.join('CWrappers', 'Other', 'manifest.json')))
+
+    def test_IdenticalOutputsAreNotRewritten(self):
+        self.generate()
+        self.resetModified()
+        output = self.generate(generateGmock=False)
+        
+        self.assertIn('Parsing files', output)
+        self.assertEqual([], self.getModified())
+
+    def test_ChangedHeaderIsReparsed(self):
+        self.generate()
+        self.resetModified()
+        with open(self.header, 'at') as file:
+            file.write('BOOL WINAPI Added(HANDLE hObject);\n')
+        output = self.generate()
+        
+        self.assertIn('Parsing files', output)
+        self.assertEqual([], self.getModified())
+
+    def test_FailedGenerationKeepsOutputs(self):
+        self.generate()
+        self.resetModified()
+        
+        def fail(aggregate):
+            raise RuntimeError('generation failed')
+            yield
+        mock_aggregate_parts = FunctionAggregate.mock_aggregate_parts
+        FunctionAggregate.mock_aggregate_parts = fail
+        try:
+            self.assertRaises(RuntimeError, self.generate, force=True)
+        finally:
+            FunctionAggregate.mock_aggregate_parts = mock_aggregate_parts
+        
+        self.assertEqual([], self.getModified())
+        self.assertEqual([], [name for root, dirs, names in os.walk('CWrappers') for name in names if name.endswith('.tmp')])
+
+    def test_DepfileListsInputs(self):
+        self.generate(depfile='wrappers.d')
+        with open('wrappers.d', 'rt') as file:
+            targets, prerequisites = file.read().split(': ')
+        
+        self.assertEqual(' '.join(path.replace(os.sep, '/') for path in self.outputs), targets)
+        self.assertEqual(
+            [self.function_file, self.header, texttemplates.__file__],
+            [path.replace('/', os.sep) for path in prerequisites.replace('\\\n', '').split()])
+
+class TestPolicyWrappers(GenerationTestCase):
+
+    def test_PolicyWrappersAreStaticallyBound(self):
+        self.generate(policy=True)
+        interfaces, components, mocks = [open(path, 'rt').read() for path in self.outputs]
+        
+        self.assertNotIn('virtual', interfaces + components + mocks)
+        self.assertIn('template <class Implementation> class IHandlesWrapper;', interfaces)
+        self.assertIn('class Test::IHandlesWrapper : public ICloseHandle<Implementation>\n', interfaces)
+        self.assertIn('return static_cast<const Implementation&>(*this).myCloseHandle(hObject);', interfaces)
+        self.assertIn('class Test::Component::HandlesWrapper : public Test::IHandlesWrapper<Test::Component::HandlesWrapper>\n', components)
+        self.assertIn('class Test::Mock::HandlesWrapper : public Test::IHandlesWrapper<Test::Mock::HandlesWrapper>\n', mocks)
+
+class TestFinalComponents(GenerationTestCase):
+
+    def test_ComponentsAreFinal(self):
+        self.generate(final=True)
+        interfaces, components, mocks = [open(path, 'rt').read() for path in self.outputs]
+        
+        self.assertNotIn('final', interfaces + mocks)
+        self.assertIn('class Test::Component::HandlesWrapper final : public Test::IHandlesWrapper\n', components)
+        self.assertIn('myCloseHandle (HANDLE hObject) const final\n', components)
+
+class TestFlatAggregates(GenerationTestCase):
+
+    def test_AggregatesDeclareTheirFunctions(self):
+        with open(self.function_file, 'rt') as file:
+            functions = file.read()
+        with open(self.function_file, 'wt') as file:
+            file.write(functions.replace('{name: CloseHandle,', '{narrow: true, name: CloseHandle,'))
+        self.generate(flat=True)
+        interfaces = open(self.outputs[0], 'rt').read()
+        
+        self.assertIn('class Test::IHandlesWrapper : public ICloseHandle\n', interfaces)
+        self.assertIn('class Test::IMasterCWrapper : public ICloseHandle\n', interfaces)
+        self.assertIn('virtual HANDLE myGetCurrentProcess (void) const = 0;', interfaces.split('class Test::IMasterCWrapper')[1])
+        self.assertEqual(1, interfaces.count('virtual BOOL myCloseHandle'))
+
+    def test_PolicyIsRejectedBeforeWritingAnything(self):
+        self.assertRaises(Exception, self.generate, policy=True, flat=True, depfile='wrappers.d')
+        sys.stdout = io.StringIO()
+        try:
+            with self.assertRaises(SystemExit) as exit:
+                cfunctionwrapper.parseArguments([self.function_file, '--policy', '--flat', '--depfile', 'wrappers.d'])
+        finally:
+            sys.stdout = sys.__stdout__
+        
+        self.assertEqual(2, exit.exception.code)
+        self.assertFalse(os.path.exists('wrappers.d'))
+        self.assertFalse(os.path.exists('CWrappers'))
+
+class TestFunctionTables(GenerationTestCase):
+
+    def test_AggregatesAreFunctionPointerTables(self):
+        self.generate(table=True)
+        interfaces, components, mocks = [open(path, 'rt').read() for path in self.outputs]
+
+        self.assertIn('struct Test::IHandlesWrapper\n{\n    BOOL (WINAPI *myCloseHandle) (HANDLE hObject);\n};', interfaces)
+        self.assertNotIn('class', interfaces)
+        self.assertIn('inline const Test::IMasterCWrapper& Test::Component::MasterCWrapper()', components)
+        self.assertIn('&CloseHandle,\n        &GetCurrentProcess\n', components)
+        self.assertIn('MOCK_CONST_METHOD0(myGetCurrentProcess, HANDLE(void));', mocks)
+        self.assertIn('table.myGetCurrentProcess = &forward_myGetCurrentProcess;', mocks)
+        self.assertIn('static HANDLE\n    WINAPI forward_myGetCurrentProcess (void)\n', mocks)
+        self.assertIn('return filledMock()->myGetCurrentProcess();', mocks)
+
+class TestOutOfLineComponents(GenerationTestCase):
+
+    def test_ComponentFunctionsAreDefinedInSources(self):
+        self.generate(out_of_line=True)
+        components = open(self.outputs[1], 'rt').read()
+        component_dir = os.path.dirname(self.outputs[1])
+        sources = [os.path.join(component_dir, name) for name in ('CWrappers.cpp', 'HandlesWrapper.cpp', 'MasterCWrapper.cpp')]
+        handles = open(sources[1], 'rt').read()
+
+        self.assertTrue(all(os.path.exists(path) for path in sources))
+        self.assertNotIn('#include <sample.h>', components)
+        self.assertIn('    myCloseHandle (HANDLE hObject) const;\n', components)
+        self.assertIn('#include <sample.h>\n#include <Test/Component/CWrappers.h>\n', handles)
+        self.assertIn('BOOL\nTest::Component::HandlesWrapper::myCloseHandle (HANDLE hObject) const\n{\n    return CloseHandle(hObject);\n}\n', handles)
+        self.assertIn('return GetCurrentProcess();', open(sources[2], 'rt').read())
+
+    def test_FailedGenerationKeepsSources(self):
+        self.generate(out_of_line=True)
+        component_dir = os.path.dirname(self.outputs[1])
+        sources = [os.path.join(component_dir, name) for name in ('CWrappers.cpp', 'HandlesWrapper.cpp', 'MasterCWrapper.cpp')]
+        texts = [open(path, 'rt').read() for path in sources]
+        
+        def fail(aggregate):
+            raise RuntimeError('generation failed')
+            yield
+        mock_aggregate_parts = FunctionAggregate.mock_aggregate_parts
+        FunctionAggregate.mock_aggregate_parts = fail
+        try:
+            self.assertRaises(RuntimeError, self.generate, out_of_line=True, funcPrefix='other', force=True)
+        finally:
+            FunctionAggregate.mock_aggregate_parts = mock_aggregate_parts
+        
+        self.assertEqual(texts, [open(path, 'rt').read() for path in sources])
+        self.assertEqual([], [name for root, dirs, names in os.walk('CWrappers') for name in names if name.endswith('.tmp')])
+
+    def test_StaleSourcesAreRemoved(self):
+        self.generate(out_of_line=True)
+        component_dir = os.path.dirname(self.outputs[1])
+        with open(self.function_file, 'rt') as file:
+            config = file.read()
+        with open(self.function_file, 'wt') as file:
+            file.write(config.replace('name: Handles', 'name: Processes'))
+        
+        output = self.generate(out_of_line=True)
+        
+        self.assertIn('Removing stale source {0}'.format(os.path.join(component_dir, 'HandlesWrapper.cpp')), output)
+        self.assertEqual(['CWrappers.cpp', 'MasterCWrapper.cpp', 'ProcessesWrapper.cpp'], sorted(name for name in os.listdir(component_dir) if name.endswith('.cpp')))
+        
+        self.generate()
+        
+        self.assertEqual([], [name for name in os.listdir(component_dir) if name.endswith('.cpp')])
+
+class TestGenerationStats(GenerationTestCase):
+
+    def test_StatsAreWritten(self):
+        self.generate(stats_file='stats.json')
+        with open('stats.json', 'rt') as file:
+            stats = json.load(file)
+        
+        header, = stats['headers']
+        self.assertEqual(('sample.h', os.path.getsize(self.header)), (header['header'], header['bytes']))
+        self.assertEqual(2, header['nodes'])
+        self.assertTrue(header['tokens'] > 0)
+        self.assertEqual(['Handles', 'MasterC'], [a['name'] for a in stats['aggregates']])
+        self.assertEqual(list(self.outputs), [o['path'] for o in stats['outputs']])
+        self.assertEqual(
+            sum(os.path.getsize(path) for path in self.outputs),
+            stats['bytes_written'])
+
+    def test_UnmatchedAggregatorFunctionsAreReported(self):
+        with open(self.function_file, 'at') as file:
+            file.write('  - {name: Process, functions: [Missing, GetCurrentProcess, CloseHandle]}\n')
+        output = self.generate(stats_file='stats.json')
+        with open('stats.json', 'rt') as file:
+            stats = json.load(file)
+        
+        self.assertIn('Aggregator Process lists functions that were not wrapped: Missing\n', output)
+        self.assertEqual(
+            [('Handles', 1, []), ('Process', 2, ['Missing']), ('MasterC', 2, [])],
+            [(a['name'], a['functions'], a['missing']) for a in stats['aggregates']])
+
+class TestWatch(GenerationTestCase):
+
+    def test_OnlyChangedHeadersAreReparsed(self):
+        other = os.path.join(self.tempdir, 'other.h')
+        with open(other, 'wt') as file:
+            file.write('int other(int a);\n')
+        with open(self.function_file, 'rt') as file:
+            functions = file.read()
+        with open(self.function_file, 'wt') as file:
+            file.write(functions.replace('Aggregators:', '  - {name: other, real_header: other.h, include_header: other.h}\nAggregators:'))
+        
+        runs = []
+        def sleep(interval):
+            with open('stats.json', 'rt') as file:
+                runs.append(dict((header['header'], header['cached']) for header in json.load(file)['headers']))
+            if len(runs) == 2:
+                raise KeyboardInterrupt
+            with open(other, 'at') as file:
+                file.write('int added(int a);\n')
+        
+        sys.stdout = io.StringIO()
+        try:
+            with mock.patch('time.sleep', sleep):
+                cfunctionwrapper.watch(self.function_file, self.include_path, use_cache=False, base_namespace='Test', stats_file='stats.json')
+        finally:
+            sys.stdout = sys.__stdout__
+        
+        self.assertEqual([
+            {'sample.h': False, 'other.h': False},
+            {'sample.h': True, 'other.h': False}], runs)
+
+class TestGenerationServer(GenerationTestCase):
+
+    def test_RequestsReuseParsedHeaders(self):
+        server = GenerationServer(None)
+        request = {
+            'cwd': self.tempdir,
+            'argv': [self.function_file, '-i', self.include_path, '-b', 'Test', '--no-cache', '-f'],
+            'include': None}
+        
+        server.handle(request)
+        second = server.handle(request)
+        
+        self.assertEqual(0, second['status'])
+        self.assertEqual(list(self.outputs), second['outputs'])
+        self.assertEqual((1, 1), (server.getCache(False, '').hits, server.getCache(False, '').misses))
+
+    def test_ErrorsAreReturned(self):
+        response = GenerationServer(None).handle({
+            'cwd': self.tempdir,
+            'argv': [self.function_file, '--unknown'],
+            'include': None})
+        
+        self.assertEqual(2, response['status'])
+        self.assertIn('option --unknown not recognized', response['output'])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -155,6 +155,63 @@ COMPONENT_FUNCTION_TEMPLATE = \
 
 '''
 
+'''
+String template used for declaring individual wrapper functions
+implemented out of line
+
+{0} = Return type
+{1} = Wrapper function prefix
+{2} = Wrapped function name
+{3} = Function Argument type and names list
+{4} = Function Qualifier (optional)
+'''
+COMPONENT_DECLARATION_TEMPLATE = \
+'''{0}
+    {1}{2} ({3}) {4};
+
+'''
+
+'''
+String template used for generating the out of line definitions of
+individual wrapper functions
+
+{0} = Return type
+{1} = Fully qualified class name
+{2} = Wrapper function prefix
+{3} = Wrapped function name
+{4} = Function Argument type and names list
+{5} = Function Qualifier (optional)
+{6} = Function Argument names list
+'''
+COMPONENT_DEFINITION_TEMPLATE = \
+'''{0}
+{1}::{2}{3} ({4}) {5}
+{{
+    return {3}({6});
+}}
+
+'''
+
+'''
+String template used for the source files holding the out of line
+definitions of the component functions
+
+{0} = Necessary headers (include real C function prototypes)
+{1} = Component CWrappers.h include directory
+{2} = Function definitions
+'''
+COMPONENT_SOURCE_FILE_TEMPLATE = \
+'''/** @file
+    GENERATED by CFunctionWrapperGenerator
+    DO NOT MODIFY
+*/
+
+{0}
+#include <{1}/CWrappers.h>
+
+{2}
+'''
+
 '''
 {0} = GMock MOCK_METHOD* or MOCK_CONST_METHOD* name
 {1} = Mocked function name
@@ -163,4 +220,220 @@ COMPONENT_FUNCTION_TEMPLATE = \
 '''
 GMOCK_DECLARATION_TEMPLATE = '''{0}({1}, {2}({3}));
 
-'''
\ No newline at end of file
+'''
+'''
+String template used for generating individual interface class templates
+when generating policy wrappers.  Each function forwards to the class
+given as Implementation, which derives from the interface
+
+{0} = Fully qualified interface name
+{1} = Functions
+{2} = Class Name
+'''
+POLICY_INTERFACE_CLASS_TEMPLATE = \
+'''template <class Implementation>
+class {0}
+{{
+public:
+    {1}
+protected:
+    ~{2}() {{}}
+}};
+
+'''
+
+'''
+String template used for generating aggregate interface class templates
+when generating policy wrappers
+
+{0} = Fully qualified interface name
+{1} = List of inherited interface class templates, bound to Implementation
+{2} = Class Name
+'''
+POLICY_INHERITING_INTERFACE_TEMPLATE = \
+'''template <class Implementation>
+class {0} : public {1}
+{{
+protected:
+    ~{2}() {{}}
+}};
+
+'''
+
+'''
+String template used for generating the classes implementing an interface
+class template when generating policy wrappers
+
+{0} = Fully qualified class name
+{1} = Fully qualified interface name, bound to the class
+{2} = Functions
+'''
+POLICY_INHERITING_CLASS_TEMPLATE = \
+'''class {0} : public {1}
+{{
+public:
+    {2}
+}};
+
+'''
+
+'''
+String template used for generating individual interface functions when
+generating policy wrappers
+
+{0} = Return type
+{1} = Wrapper function prefix
+{2} = Wrapped function name
+{3} = Function Argument type and names list
+{4} = Function Qualifier (optional)
+{5} = Function Argument names list
+'''
+POLICY_FUNCTION_TEMPLATE = \
+'''{0}
+    {1}{2} ({3}) {4}
+    {{
+        return static_cast<const Implementation&>(*this).{1}{2}({5});
+    }}
+
+'''
+
+'''
+String template used for declaring classes in their namespace
+
+{0} = Class Name
+'''
+CLASS_DECLARATION_TEMPLATE = 'class {0};'
+
+'''
+String template used for declaring interface class templates in their
+namespace when generating policy wrappers
+
+{0} = Class Name
+'''
+POLICY_DECLARATION_TEMPLATE = 'template <class Implementation> class {0};'
+
+'''
+String template used for generating the function pointer table of an
+aggregate when generating tables
+
+{0} = Fully qualified table name
+{1} = Function pointers
+'''
+TABLE_STRUCT_TEMPLATE = \
+'''struct {0}
+{{
+    {1}
+}};
+
+'''
+
+'''
+String template used for generating individual function pointers of a
+table
+
+{0} = Return type
+{1} = Wrapper function prefix
+{2} = Wrapped function name
+{3} = Function Argument type and names list
+{4} = Calling convention of the wrapped function followed by a space, if any
+'''
+TABLE_FIELD_TEMPLATE = '{0} ({4}*{1}{2}) ({3});'
+
+'''
+String template used for generating the function returning the table of
+the real C functions when generating tables
+
+{0} = Fully qualified table name
+{1} = Fully qualified function name
+{2} = Addresses of the wrapped functions
+'''
+TABLE_COMPONENT_TEMPLATE = \
+'''inline const {0}& {1}()
+{{
+    static const {0} table =
+    {{
+        {2}
+    }};
+    return table;
+}}
+
+'''
+
+'''
+String template used for generating the mock filling a table when
+generating tables.  The functions it puts in the table forward to the mock
+that filled a table last
+
+{0} = Fully qualified class name
+{1} = Fully qualified table name
+{2} = Mock functions
+{3} = Assignments of the forwarding functions to the table
+{4} = Forwarding functions
+{5} = Class Name
+'''
+TABLE_MOCK_TEMPLATE = \
+'''class {0}
+{{
+public:
+    ~{5}()
+    {{
+        if (filledMock() == this)
+        {{
+            filledMock() = 0;
+        }}
+    }}
+
+    {2}void fill({1}& table) const
+    {{
+        filledMock() = this;
+        {3}
+    }}
+
+private:
+    static const {5}*& filledMock()
+    {{
+        static const {5}* mock = 0;
+        return mock;
+    }}
+
+    {4}
+}};
+
+'''
+
+'''
+String template used for generating the functions of a table mock that
+forward to the mock that filled the table
+
+{0} = Return type
+{1} = Wrapper function prefix
+{2} = Wrapped function name
+{3} = Function Argument type and names list
+{4} = Function Argument names list
+{5} = Calling convention of the wrapped function followed by a space, if any
+'''
+TABLE_FORWARDING_TEMPLATE = \
+'''static {0}
+    {5}forward_{1}{2} ({3})
+    {{
+        return filledMock()->{1}{2}({4});
+    }}
+
+'''
+
+'''
+String template used for declaring tables in their namespace when
+generating tables
+
+{0} = Table Name
+'''
+TABLE_DECLARATION_TEMPLATE = 'struct {0};'
+
+'''
+String template used for declaring the functions returning the tables of
+the real C functions in the component namespace when generating tables
+
+{0} = Component function name
+{1} = Table Name
+'''
+TABLE_COMPONENT_DECLARATION_TEMPLATE = 'const {1}& {0}();'